@@ -7,21 +7,55 @@ import logutil
 import sys
 
 # modules for downloading and URL
-from bs4 import BeautifulSoup
-from requests.exceptions import RequestException, Timeout
+import parseutil
+import statsutil
 import webutil
 
 # modules for Data Science
 import pandas as pd
 import excelutil
+import frameutil
 
 # modules for concurrency
-import concurrent.futures
-import time
+import asyncutil
+import retryutil
 from datetime import datetime
 
 ### Constant Values ###
 PAGE_TIMEOUT = 5.0
+# Name of the source whose calls in flight are limited adaptively, see retryutil.CONCURRENCY_LIMITER
+AASTOCKS_SOURCE = 'aastocks'
+AASTOCKS_DIVIDEND_URL = 'http://www.aastocks.com/en/stocks/analysis/dividend.aspx?symbol={}'
+AASTOCKS_TABLE_CLASS = 'cnhk-cf'
+AASTOCKS_TABLE_STRAINER = parseutil.make_strainer('table', {"class": AASTOCKS_TABLE_CLASS})
+# Seconds during which a cached dividend page is used without revalidation
+AASTOCKS_DIVIDEND_CACHE_TTL = 24 * 3600
+# Cells of a dividend row in order
+DIVIDEND_CELL_LABELS = ['announce_date', 'ended', 'dividend_event', 'dividend_value', 'dividend_type', 'ex_date', 'book_close', 'payable_date']
+DIVIDEND_LABELS = [
+    'stock_code', 'announce_date', 'ended_year', 'ended_month', 'dividend_event', 'dividend_type'
+    , 'dividend_amount', 'dividend_value', 'ex_date', 'book_start_date', 'book_close_date', 'payable_date'
+]
+# Compact dtypes of dividend history of many stocks for frameutil
+DIVIDEND_CELL_COLUMNS = dict([('stock_code', frameutil.DTYPE_CATEGORY)] + [(label, None) for label in DIVIDEND_CELL_LABELS])
+DIVIDEND_SCHEMA = {
+    'stock_code': frameutil.DTYPE_CATEGORY
+    , 'ended_year': frameutil.DTYPE_INT32
+    , 'ended_month': frameutil.DTYPE_INT32
+    , 'dividend_event': frameutil.DTYPE_CATEGORY
+    , 'dividend_type': frameutil.DTYPE_CATEGORY
+    , 'dividend_amount': frameutil.DTYPE_FLOAT32
+}
+DIVIDEND_DATE_FORMAT = '%Y/%m/%d'
+ENDED_PATTERN = r'^(\d{4})/(\d{2})'
+DATE_PATTERN = r'^(\d{4}/\d{2}/\d{2})'
+DATERANGE_PATTERN = r'\d{4}/\d{2}/\d{2}-\d{4}/\d{2}/\d{2}'
+HKD_PATTERN = r'HKD\s(\d*\.\d+|\d+)'
+FX_PATTERN = r'(\w{3})\s(\d*\.\d+|\d+)'
+# Conversion rates of dividend currencies into HKD, the amount is missing for other currencies
+DEFAULT_FX_RATES = {'HKD': 1.0, 'USD': 7.8, 'GBP': 12.0, 'RMB': 1.24}
+LABEL_CURRENCY = 'currency'
+LABEL_FX_RATE = 'fx_rate'
 
 def get_hk_aastocks_code(stock_number):
     '''
@@ -43,54 +77,183 @@ def get_dividend_trlist(soup_object):
                 return tr_list
     return None
 
-def get_dividend_list(tr_list, stock_code):
-    dividend_list = []
-    ENDED_PATTERN = r'\d{4}/\d{2}'
-    ended_re = re.compile(ENDED_PATTERN)
-    DATE_PATTERN = r'\d{4}/\d{2}/\d{2}'
-    date_re = re.compile(DATE_PATTERN)
-    DATERANGE_PATTERN = r'\d{4}/\d{2}/\d{2}-\d{4}/\d{2}/\d{2}'
-    daterange_re = re.compile(DATERANGE_PATTERN)
-    HKD_PATTERN = r'HKD\s(\d*\.\d+|\d+)'
-    hkd_re = re.compile(HKD_PATTERN)
-    FX_PATTERN = r'(\w{3})\s(\d*\.\d+|\d+)'
-    fx_re = re.compile(FX_PATTERN)
+# Get List of tr elements about Dividend from a soup of data tables only
+def find_dividend_trlist(table_soup):
+    searchtext = re.compile(r'^Announce\sDate$')
+    for table_item in table_soup.find_all('table', {"class": AASTOCKS_TABLE_CLASS}):
+        tr_list = table_item.find_all('tr')
+        for tr in tr_list:
+            td_list = tr.find_all('td', text=searchtext)
+            if len(td_list) > 0:
+                return tr_list
+    return None
+
+def get_fx_rate_df(fx_rates=None):
+    '''
+    Get DataFrame of conversion rate into HKD indexed by currency
+    Parameters
+    ----------
+    fx_rates : dict
+               Dict of currency and its rate into HKD, DEFAULT_FX_RATES if None
+    '''
+    fx_rates = DEFAULT_FX_RATES if fx_rates is None else fx_rates
+    return pd.DataFrame(
+        {LABEL_FX_RATE: [float(rate) for rate in fx_rates.values()]}
+        , index=pd.Index(list(fx_rates.keys()), name=LABEL_CURRENCY)
+    )
+
+def get_dividend_cells(tr_list, stock_code):
+    '''
+    Extract text of the cells of dividend rows without converting them
+    Returns
+    -------
+    list of dict of stock code and cell text by DIVIDEND_CELL_LABELS
+    '''
+    cell_list = []
     for tr in tr_list or []:
         td_list = tr.find_all('td', {'class': 'mcFont'})
-        if len(td_list) > 0:
-            hkd_match = hkd_re.search(td_list[3].text)
-            if hkd_match:
-                amount_figure = float(hkd_match.group(1))
-            else:
-                fx_match = fx_re.search(td_list[3].text)
-                if fx_match:
-                    amount_figure = float(fx_match.group(2))
-                    if fx_match.group(1) == 'USD':
-                        amount_figure = amount_figure * 7.8
-                    elif fx_match.group(1) == 'GBP':
-                        amount_figure = amount_figure * 12
-                    elif fx_match.group(1) == 'RMB':
-                        amount_figure = amount_figure * 1.24
-                else:
-                    amount_figure = 0.0
-            announce_date = datetime.strptime(td_list[0].text, '%Y/%m/%d')
-            dividend_list.append(
-                {
-                    'stock_code': stock_code
-                    , 'announce_date': announce_date
-                    , 'ended_year': int(td_list[1].text[:4] if ended_re.match(td_list[1].text) else td_list[0].text[:4])
-                    , 'ended_month': int(td_list[1].text[-2:] if ended_re.match(td_list[1].text) else td_list[0].text[5:7])
-                    , 'dividend_event': td_list[2].text
-                    , 'dividend_type': td_list[4].text
-                    , 'dividend_amount': amount_figure
-                    , 'dividend_value': td_list[3].text
-                    , 'ex_date': datetime.strptime(td_list[5].text, '%Y/%m/%d') if date_re.match(td_list[5].text) else announce_date
-                    , 'book_start_date': datetime.strptime(td_list[6].text[:10], '%Y/%m/%d') if daterange_re.match(td_list[6].text) else announce_date
-                    , 'book_close_date': datetime.strptime(td_list[6].text[-10:], '%Y/%m/%d') if daterange_re.match(td_list[6].text) else announce_date
-                    , 'payable_date': datetime.strptime(td_list[7].text, '%Y/%m/%d') if date_re.match(td_list[7].text) else announce_date
-                }
-            )
-    return dividend_list
+        if len(td_list) >= len(DIVIDEND_CELL_LABELS):
+            cell_dict = {'stock_code': stock_code}
+            cell_dict.update(zip(DIVIDEND_CELL_LABELS, [td.text for td in td_list]))
+            cell_list.append(cell_dict)
+    return cell_list
+
+def parse_date_column(text_series, pattern, default_series):
+    '''
+    Parse the dates matched by the pattern at the beginning of text, the default where it does not match
+    '''
+    date_series = pd.to_datetime(text_series.str.extract(pattern, expand=False), format=DIVIDEND_DATE_FORMAT, errors='coerce')
+    return date_series.fillna(default_series)
+
+@statsutil.timed('convert_seconds', source='aastocks')
+def convert_dividend_df(cell_df, fx_rates=None):
+    '''
+    Convert cells of dividend rows, usually of many stocks at once, into typed columns
+    Parameters
+    ----------
+    cell_df : Pandas DataFrame
+              DataFrame of dict from get_dividend_cells
+    fx_rates : dict
+               Dict of currency and its rate into HKD, DEFAULT_FX_RATES if None
+    Returns
+    -------
+    Pandas DataFrame of dividend history, the amount is in HKD
+    '''
+    if len(cell_df) <= 0:
+        return pd.DataFrame(columns=DIVIDEND_LABELS)
+    cell_df = cell_df.astype({label: 'string' for label in DIVIDEND_CELL_LABELS})
+    announce_date = pd.to_datetime(cell_df['announce_date'], format=DIVIDEND_DATE_FORMAT, errors='coerce')
+
+    # The financial year ended falls back to the announce date
+    ended = cell_df['ended'].str.extract(ENDED_PATTERN)
+    ended = ended.fillna(cell_df['announce_date'].str.extract(ENDED_PATTERN))
+
+    # An amount in HKD wins, otherwise the first amount in other currency is converted by the rate table
+    hkd_amount = cell_df['dividend_value'].str.extract(HKD_PATTERN, expand=False)
+    fx_amount = cell_df['dividend_value'].str.extract(FX_PATTERN)
+    amount_df = pd.DataFrame({
+        LABEL_CURRENCY: fx_amount[0].where(hkd_amount.isna(), 'HKD')
+        , 'figure': pd.to_numeric(hkd_amount.fillna(fx_amount[1]), errors='coerce')
+    }, index=cell_df.index).join(get_fx_rate_df(fx_rates), on=LABEL_CURRENCY)
+    dividend_amount = (amount_df['figure'] * amount_df[LABEL_FX_RATE]).where(amount_df['figure'].notna(), 0.0)
+
+    book_range = cell_df['book_close'].where(cell_df['book_close'].str.match(DATERANGE_PATTERN))
+    return pd.DataFrame({
+        'stock_code': cell_df['stock_code']
+        , 'announce_date': announce_date
+        , 'ended_year': pd.to_numeric(ended[0], errors='coerce').astype('Int64')
+        , 'ended_month': pd.to_numeric(ended[1], errors='coerce').astype('Int64')
+        , 'dividend_event': cell_df['dividend_event']
+        , 'dividend_type': cell_df['dividend_type']
+        , 'dividend_amount': dividend_amount.astype('float64')
+        , 'dividend_value': cell_df['dividend_value']
+        , 'ex_date': parse_date_column(cell_df['ex_date'], DATE_PATTERN, announce_date)
+        , 'book_start_date': parse_date_column(book_range.str[:10], DATE_PATTERN, announce_date)
+        , 'book_close_date': parse_date_column(book_range.str[-10:], DATE_PATTERN, announce_date)
+        , 'payable_date': parse_date_column(cell_df['payable_date'], DATE_PATTERN, announce_date)
+    }, index=cell_df.index, columns=DIVIDEND_LABELS)
+
+def get_dividend_list(tr_list, stock_code, fx_rates=None):
+    return convert_dividend_df(
+        pd.DataFrame(get_dividend_cells(tr_list, stock_code), columns=['stock_code'] + DIVIDEND_CELL_LABELS)
+        , fx_rates
+    ).to_dict('records')
+
+@statsutil.timed('parse_seconds', source='aastocks')
+def parse_dividend_cells(decoded_result, stock_code):
+    '''
+    Parse AASTOCKS dividend page into list of dict of cell text, see get_dividend_cells
+    '''
+    # Only the data tables are built, the table headed by Announce Date is the dividend history
+    table_soup = parseutil.make_soup(decoded_result, parse_only=AASTOCKS_TABLE_STRAINER)
+    tr_list = find_dividend_trlist(table_soup)
+    return get_dividend_cells(tr_list, stock_code)
+
+def parse_dividend_cell_content(content, stock_code):
+    '''
+    Parse AASTOCKS dividend page in bytes into list of dict of cell text
+    '''
+    with statsutil.STATS.timer('decode_seconds', source='aastocks'):
+        decoded_result = content.decode('utf-8', 'ignore')
+    if len(decoded_result) <= 0:
+        raise retryutil.ParseError('Failed to retrieve content.')
+    return parse_dividend_cells(decoded_result, stock_code)
+
+def parse_dividend_page(stock_code, decoded_result):
+    '''
+    Parse decoded AASTOCKS dividend page of a stock, the parse function of asyncutil.fetch_all
+    '''
+    return parse_dividend_cells(decoded_result, stock_code)
+
+def fetch_dividend_cells(
+    stock_code
+    , proxy_flag=False
+    , timeout=PAGE_TIMEOUT
+    , cache_ttl=AASTOCKS_DIVIDEND_CACHE_TTL
+    ):
+    '''
+    Download cells of dividend rows once and raise error if it fails.
+    The page goes through webutil.RESPONSE_CACHE unless cache_ttl is None.
+    '''
+    logger = logutil.getLogger(__name__)
+
+    proxy_server = None
+    if proxy_flag:
+        proxy_server = webutil.PROXY_POOL.get_proxy()
+        logger.info('download via a proxy server: %s', proxy_server['ip'] + ':' + proxy_server['port'])
+
+    data_url = AASTOCKS_DIVIDEND_URL.format(stock_code)
+    if cache_ttl is None:
+        response = webutil.create_get_request(url=data_url, proxy_server=proxy_server, timeout=timeout)
+        if response.status_code != 200:
+            response.raise_for_status()
+        return parse_dividend_cell_content(response.content, stock_code)
+    return webutil.RESPONSE_CACHE.get_parsed(
+        data_url
+        , lambda content: parse_dividend_cell_content(content, stock_code)
+        , cache_ttl
+        , parser_name=webutil.get_func_name(parse_dividend_cell_content)
+        , proxy_server=proxy_server
+        , timeout=timeout
+    )
+
+def fetch_dividend_hist(
+    stock_code
+    , proxy_flag=False
+    , timeout=PAGE_TIMEOUT
+    , cache_ttl=AASTOCKS_DIVIDEND_CACHE_TTL
+    , fx_rates=None
+    ):
+    '''
+    Download dividend history once and raise error if it fails
+    '''
+    return convert_dividend_df(
+        pd.DataFrame(
+            fetch_dividend_cells(stock_code, proxy_flag=proxy_flag, timeout=timeout, cache_ttl=cache_ttl)
+            , columns=['stock_code'] + DIVIDEND_CELL_LABELS
+        )
+        , fx_rates
+    ).to_dict('records')
 
 def download_dividend_hist(
     stock_code
@@ -98,66 +261,193 @@ def download_dividend_hist(
     , retry_time=3
     , retry_delay=10
     , timeout=PAGE_TIMEOUT
+    , cache_ttl=AASTOCKS_DIVIDEND_CACHE_TTL
+    , fx_rates=None
     ):
-    logger = logutil.getLogger(__name__)
+    result = retryutil.call_with_retry(
+        lambda: fetch_dividend_hist(stock_code, proxy_flag=proxy_flag, timeout=timeout, cache_ttl=cache_ttl, fx_rates=fx_rates)
+        , key=stock_code
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+    )
+    return result.value or []
+
+def iter_dividend_cells(
+    stock_code_list
+    , max_workers=10
+    , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , cache_ttl=AASTOCKS_DIVIDEND_CACHE_TTL
+    , callback=None
+    , checkpoint=None
+    , adaptive=False
+    ):
+    '''
+    Yield list of dict of cell text of dividend rows as soon as each stock completes
+    Parameters
+    ----------
+    callback : function
+               function of (retryutil.RetryResult, number of completed stocks, number of stocks)
+               called for every stock before its cells are yielded
+    checkpoint : checkpoint.Checkpoint
+                 stocks completed in it are not downloaded again, and every stock is saved in it as it completes
+    adaptive : boolean
+               Whether calls in flight are limited by retryutil.CONCURRENCY_LIMITER of the source up to max_workers
+    Returns
+    -------
+    generator of list of dict of cell text, see get_dividend_cells
+    '''
+    # Size the shared connection pools to the number of threads
+    webutil.get_session(pool_size=max_workers)
+    for result in retryutil.iter_batch(
+        lambda stock_code: fetch_dividend_cells(stock_code, proxy_flag=proxy_flag, timeout=timeout, cache_ttl=cache_ttl)
+        , stock_code_list
+        , max_workers=max_workers
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+        , callback=callback
+        , checkpoint=checkpoint
+        , concurrency=retryutil.CONCURRENCY_LIMITER.get_concurrency(AASTOCKS_SOURCE) if adaptive else None
+    ):
+        yield result.value or []
 
-    dividend_list = []
-    data_url = 'http://www.aastocks.com/en/stocks/analysis/dividend.aspx?symbol={}'.format(stock_code)
-    for _ in range(retry_time):
-        try:
-            proxy_server = None
-            if proxy_flag:
-                proxy_server = webutil.get_random_proxy()
-                logger.info('download via a proxy server: %s', proxy_server['ip'] + ':' + proxy_server['port'])
-
-            response = webutil.create_get_request(url=data_url, proxy_server=proxy_server, timeout=timeout)
-            if response.status_code != 200:
-                response.raise_for_status()
-            decoded_result = response.content.decode('utf-8', 'ignore')
-            if len(decoded_result) <= 0:
-                logger.error('Failed to retrieve content.')
-                continue
-            stock_soup = BeautifulSoup(decoded_result, 'html.parser')
-
-            tr_list = get_dividend_trlist(stock_soup)
-            dividend_list = get_dividend_list(tr_list, stock_code)
-            break
-        except Timeout:
-            logger.error('socket timed out - URL %s', data_url)
-            time.sleep(retry_delay)
-        except RequestException as error:
-            logger.error('Data not retrieved because %s\nURL: %s', error, data_url)
-            time.sleep(retry_delay)
-        except Exception as error:
-            logger.error('Unexpected error of %s\nURL: %s', error, data_url)
-            time.sleep(retry_delay)            
-    else:
-        logger.error('No response after %d retry.' % retry_time)
-    return dividend_list
+def iter_dividend_hist(
+    stock_code_list
+    , max_workers=10
+    , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , cache_ttl=AASTOCKS_DIVIDEND_CACHE_TTL
+    , callback=None
+    , checkpoint=None
+    , adaptive=False
+    , fx_rates=None
+    ):
+    '''
+    Yield dividend records in format of dictionary as soon as each stock completes
+    Parameters
+    ----------
+    callback : function
+               function of (retryutil.RetryResult, number of completed stocks, number of stocks)
+               called for every stock before its dividend records are yielded
+    checkpoint : checkpoint.Checkpoint
+                 stocks completed in it are not downloaded again, and every stock is saved in it as it completes
+    adaptive : boolean
+               Whether calls in flight are limited by retryutil.CONCURRENCY_LIMITER of the source up to max_workers
+    Returns
+    -------
+    generator of dividend record in format of dictionary
+    '''
+    for cell_list in iter_dividend_cells(
+        stock_code_list
+        , max_workers=max_workers
+        , proxy_flag=proxy_flag
+        , retry_time=retry_time
+        , retry_delay=retry_delay
+        , timeout=timeout
+        , cache_ttl=cache_ttl
+        , callback=callback
+        , checkpoint=checkpoint
+        , adaptive=adaptive
+    ):
+        if len(cell_list) > 0:
+            for dividend_dict in convert_dividend_df(pd.DataFrame(cell_list), fx_rates).to_dict('records'):
+                yield dividend_dict
 
 def download_dividend_hist_df(
     stock_code_list
     , max_workers=10
     , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , cache_ttl=AASTOCKS_DIVIDEND_CACHE_TTL
+    , return_status=False
+    , checkpoint=None
+    , adaptive=False
+    , fx_rates=None
     ):
+    '''
+    Get Data Frame of dividend history by a list of stock codes
+    Parameters
+    ----------
+    return_status : boolean
+                    Whether a Data Frame of attempts and final status per stock is returned as well
+    checkpoint : checkpoint.Checkpoint
+                 stocks completed in it are not downloaded again, see retryutil.iter_batch
+    adaptive : boolean
+               Whether calls in flight are limited by retryutil.CONCURRENCY_LIMITER of the source up to max_workers
+    fx_rates : dict
+               Dict of currency and its rate into HKD, DEFAULT_FX_RATES if None
+    Returns
+    -------
+    Data Frame of dividend history, or a tuple of it and the status Data Frame
+    '''
     logger = logutil.getLogger(__name__)
 
-    stock_dividend_hist_list = []   
+    result_list = []
     # Threads start and it takes quite a long time due to multiple network I/O
     logger.info('It starts to download stock dividend list. Please wait.')
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_stock_code = {
-            executor.submit(download_dividend_hist, stock_code, proxy_flag): 
-            stock_code for stock_code in stock_code_list
-        }
-
-    # Update thread status for monitoring
-    for future in concurrent.futures.as_completed(future_to_stock_code):
-        stock_dividend_hist_list.extend(future.result())
+    cell_builder = frameutil.ColumnBuilder(DIVIDEND_CELL_COLUMNS)
+    for stock_cell_list in iter_dividend_cells(
+        stock_code_list
+        , max_workers=max_workers
+        , proxy_flag=proxy_flag
+        , retry_time=retry_time
+        , retry_delay=retry_delay
+        , timeout=timeout
+        , cache_ttl=cache_ttl
+        , callback=lambda result, completed_count, total_count: result_list.append(result)
+        , checkpoint=checkpoint
+        , adaptive=adaptive
+    ):
+        cell_builder.extend(stock_cell_list)
     
     logger.info('Downloading stock dividend list completed.')
-    return pd.DataFrame(
-        data=stock_dividend_hist_list
+    # Cells of every stock are converted at once
+    stock_dividend_hist_df = frameutil.apply_schema(
+        convert_dividend_df(cell_builder.to_df(), fx_rates)
+        , DIVIDEND_SCHEMA
+        )
+    if return_status:
+        return stock_dividend_hist_df, retryutil.get_status_df(result_list)
+    return stock_dividend_hist_df
+
+async def download_dividend_hist_df_async(
+    stock_code_list
+    , concurrency=asyncutil.DEFAULT_CONCURRENCY
+    , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , fx_rates=None
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+    ):
+    '''
+    Asyncio counterpart of download_dividend_hist_df running up to concurrency requests at the same time
+    '''
+    logger = logutil.getLogger(__name__)
+
+    logger.info('It starts to download stock dividend list. Please wait.')
+    result_list = await asyncutil.fetch_all(
+        [(stock_code, AASTOCKS_DIVIDEND_URL.format(stock_code)) for stock_code in stock_code_list]
+        , parse_dividend_page
+        , concurrency=concurrency
+        , proxy_flag=proxy_flag
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+        , timeout=timeout
+        , parse_workers=parse_workers
+    )
+
+    cell_builder = frameutil.ColumnBuilder(DIVIDEND_CELL_COLUMNS)
+    for result in result_list:
+        cell_builder.extend(result.value or [])
+
+    logger.info('Downloading stock dividend list completed.')
+    return frameutil.apply_schema(
+        convert_dividend_df(cell_builder.to_df(), fx_rates)
+        , DIVIDEND_SCHEMA
         )
 
 ### Run as a main program ###
@@ -0,0 +1,202 @@
+'''
+Utility module of asyncio Web operation
+'''
+# core modules
+import functools
+import logutil
+
+# modules for downloading and URL
+import webutil
+import parseutil
+import retryutil
+import statsutil
+from urllib.parse import urlsplit
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# modules for concurrency
+import asyncio
+import time
+
+### Constant Values ###
+DEFAULT_CONCURRENCY = 100
+
+def create_client_session(concurrency=DEFAULT_CONCURRENCY):
+    '''
+    Create an aiohttp session whose connection pool matches the concurrency limit
+    '''
+    if aiohttp is None:
+        raise ImportError('aiohttp is required by the asyncio fetch engine')
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+    return aiohttp.ClientSession(connector=connector)
+
+async def create_get_request(
+    session
+    , url
+    , user_agent = webutil.DEFAULT_USER_AGENT
+    , referer = webutil.DEFAULT_REFERER
+    , cookies = None
+    , proxy_server = None
+    , timeout = None
+):
+    '''
+    Get decoded content of a URL, the asyncio counterpart of webutil.create_get_request
+    Parameters
+    ----------
+    session : aiohttp.ClientSession
+              Session created by create_client_session
+    url : string
+          URL to download
+    proxy_server : dict
+                   Proxy Server (ip, port), which tunnels https URLs as well like webutil does
+    timeout : float
+              Seconds to wait for the whole response
+    Returns
+    -------
+    Content of the response decoded in UTF-8
+    '''
+    headers = {
+        'User-Agent': user_agent
+        , 'referer': referer
+    }
+    proxy = None
+    if proxy_server is not None:
+        proxy = 'http://' + webutil.get_proxy_key(proxy_server)
+
+    labels = {
+        'source': urlsplit(url).netloc
+        , 'proxy': 'direct' if proxy_server is None else webutil.get_proxy_key(proxy_server)
+    }
+    wait_time = webutil.RATE_LIMITER.reserve(url)
+    if wait_time > 0:
+        statsutil.STATS.observe('rate_wait_seconds', wait_time, **labels)
+        await asyncio.sleep(wait_time)
+    start_time = time.perf_counter()
+    try:
+        async with session.get(
+            url
+            , headers=headers
+            , cookies=cookies
+            , proxy=proxy
+            , timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            headers_time = time.perf_counter()
+            statsutil.STATS.observe('headers_seconds', headers_time - start_time, **labels)
+            statsutil.STATS.increment('requests_total', status=response.status, **labels)
+            response.raise_for_status()
+            content = await response.read()
+    except aiohttp.ClientResponseError as error:
+        statsutil.STATS.observe('request_seconds', time.perf_counter() - start_time, **labels)
+        if proxy_server is not None:
+            webutil.PROXY_POOL.report(proxy_server, error.status < 500, time.perf_counter() - start_time)
+        webutil.RATE_LIMITER.report(url, error.status, error.headers)
+        raise
+    except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+        statsutil.STATS.increment('request_errors_total', error=type(error).__name__, **labels)
+        statsutil.STATS.observe('request_seconds', time.perf_counter() - start_time, **labels)
+        if proxy_server is not None:
+            webutil.PROXY_POOL.report(proxy_server, False, time.perf_counter() - start_time)
+        raise
+    end_time = time.perf_counter()
+    statsutil.STATS.observe('body_seconds', end_time - headers_time, **labels)
+    statsutil.STATS.observe('request_seconds', end_time - start_time, **labels)
+    statsutil.STATS.increment('response_bytes_total', len(content), **labels)
+    if proxy_server is not None:
+        webutil.PROXY_POOL.report(proxy_server, True, end_time - start_time)
+    webutil.RATE_LIMITER.report(url, 200)
+    with statsutil.STATS.timer('decode_seconds', source=labels['source']):
+        return content.decode('utf-8', 'ignore')
+
+async def fetch_parse(
+    session
+    , semaphore
+    , key
+    , url
+    , parse_func
+    , proxy_flag=False
+    , policies=None
+    , timeout=None
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+):
+    '''
+    Download a URL and parse its content, backing off without blocking other requests.
+    The parse runs off the event loop, in a thread or in the parser process pool if parse_workers is positive.
+    Returns
+    -------
+    RetryResult of the key with the parsed result as its value
+    '''
+    logger = logutil.getLogger(__name__)
+    policies = policies or retryutil.get_default_policies()
+    loop = asyncio.get_running_loop()
+    result = retryutil.RetryResult(key)
+    while True:
+        result.attempts += 1
+        try:
+            proxy_server = None
+            if proxy_flag:
+                # The first load of proxy list is blocking network I/O
+                proxy_server = await loop.run_in_executor(None, webutil.PROXY_POOL.get_proxy)
+                logger.info('download via a proxy server: %s', webutil.get_proxy_key(proxy_server))
+
+            # Only the network I/O counts towards the concurrency limit
+            async with semaphore:
+                decoded_result = await create_get_request(session, url, proxy_server=proxy_server, timeout=timeout)
+            if len(decoded_result) <= 0:
+                raise retryutil.ParseError('Failed to retrieve content.')
+            result.value = await loop.run_in_executor(
+                None
+                , functools.partial(parseutil.run_parse, parse_func, key, decoded_result, parse_workers=parse_workers)
+            )
+            result.status = retryutil.STATUS_SUCCESS
+            result.error_class = None
+            result.error = None
+            return result
+        except Exception as error:
+            delay = retryutil.handle_failure(result, error, policies)
+            if delay is None:
+                return result
+            await asyncio.sleep(delay)
+
+async def fetch_all(
+    key_url_list
+    , parse_func
+    , concurrency=DEFAULT_CONCURRENCY
+    , proxy_flag=False
+    , policies=None
+    , timeout=None
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+):
+    '''
+    Download and parse a list of URLs concurrently
+    Parameters
+    ----------
+    key_url_list : list
+                   list of (key, URL) tuples, key is usually a stock code
+    parse_func : function
+                 function of (key, decoded content) returning the parsed result,
+                 at module level if parse_workers is positive so that it can be pickled
+    concurrency : int
+                  maximum number of requests in flight at the same time
+    policies : dict
+               Dict of error class and retryutil.RetryPolicy
+    parse_workers : int
+                    number of parser processes, 0 parses in threads off the event loop
+    Returns
+    -------
+    list of retryutil.RetryResult in order of completion
+    '''
+    semaphore = asyncio.Semaphore(concurrency)
+    async with create_client_session(concurrency) as session:
+        task_list = [
+            fetch_parse(
+                session, semaphore, key, url, parse_func
+                , proxy_flag=proxy_flag
+                , policies=policies
+                , timeout=timeout
+                , parse_workers=parse_workers
+            )
+            for key, url in key_url_list
+        ]
+        return [await task for task in asyncio.as_completed(task_list)]
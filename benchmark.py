@@ -0,0 +1,387 @@
+'''
+A standalone program to benchmark the downloaders offline
+Pages are served by a local HTTP server with configurable latency and error injection,
+from recorded pages in a fixture directory if present, otherwise from synthetic pages
+which carry the markup the parsers look for. Each scenario runs in its own process
+so that its peak RSS is measured alone.
+'''
+# core modules
+import argparse
+import logging
+import os
+import random
+import resource
+import time
+
+# modules for downloading and URL
+import webutil
+import hkex_list
+import yahoo_fin
+import bloomberg_data
+import aastocks_data
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# modules for Data Science
+import numpy as np
+import pandas as pd
+
+# modules for concurrency
+import concurrent.futures
+import multiprocessing
+import threading
+
+### Constant Values ###
+TARGET_HKEX = 'hkex_list'
+TARGET_YAHOO_QUOTE = 'yahoo_quote'
+TARGET_YAHOO_HIST = 'yahoo_hist'
+TARGET_BLOOMBERG = 'bloomberg'
+TARGET_AASTOCKS = 'aastocks'
+TARGET_LIST = [TARGET_HKEX, TARGET_YAHOO_QUOTE, TARGET_YAHOO_HIST, TARGET_BLOOMBERG, TARGET_AASTOCKS]
+# Recorded page of each route in a fixture directory
+FIXTURE_FILENAMES = {
+    'hkex': 'hkex_list.html'
+    , 'yahoo_quote': 'yahoo_quote.html'
+    , 'yahoo_welcome': 'yahoo_welcome.html'
+    , 'yahoo_hist': 'yahoo_hist.csv'
+    , 'bloomberg': 'bloomberg_quote.html'
+    , 'aastocks': 'aastocks_dividend.html'
+}
+HIST_FROM_DATE = '2018-01-01'
+HIST_TO_DATE = '2019-01-01'
+FIXTURE_CRUMB = 'benchmarkCrumb'
+
+'''
+Functions of synthetic fixture pages
+'''
+def get_filler(page_kb):
+    '''
+    Get markup which no parser looks for, so that a page is as heavy as a real one
+    '''
+    block = '<div class="filler"><p>Lorem ipsum dolor sit amet</p><a href="#">link</a></div>\n'
+    return block * max(page_kb * 1024 // len(block), 0)
+
+def make_hkex_page(universe_size, page_kb):
+    row_list = [
+        '<tr class="{}"><td>{:05}</td><td>公司{}\nhttp://example.com</td><td>http://www.example.com/{}</td></tr>'.format(
+            hkex_list.HKEX_LIST_TR_CLASS_LIST[stock_id % 2], stock_id, stock_id, stock_id)
+        for stock_id in range(1, universe_size + 1)
+    ]
+    return '<html><body>{}<table>{}</table></body></html>'.format(get_filler(page_kb), '\n'.join(row_list))
+
+def make_yahoo_quote_page(page_kb):
+    value_dict = {
+        '前收市價': '60.10', '開市': '60.20', '今日波幅': '59.80 - 60.50', '52 週波幅': '55.00 - 70.00'
+        , '成交量': '12,345,678', '平均成交量': '20,000,000', '市值': '1.23T', '市盈率 (最近 12 個月)': '12.34'
+    }
+    row_list = [
+        '<tr><td class="{}">{}</td><td>{}</td></tr>'.format(yahoo_fin.YAHOO_QUOTE_TD_CLASS, label, value)
+        for label, value in value_dict.items()
+    ]
+    return '<html><body>{}<table>{}</table></body></html>'.format(get_filler(page_kb), ''.join(row_list))
+
+def make_yahoo_welcome_page(page_kb):
+    return '<html><body>{}<script>root.App.main = {{"context":{{"dispatcher":{{"stores":{{"CrumbStore":{{"crumb":"{}"}}}}}}}}}};</script></body></html>'.format(
+        get_filler(page_kb), FIXTURE_CRUMB)
+
+def make_yahoo_hist_csv():
+    date_index = pd.bdate_range(HIST_FROM_DATE, HIST_TO_DATE)
+    price = 50 + np.cumsum(np.random.normal(0, 0.5, len(date_index)))
+    return pd.DataFrame({
+        yahoo_fin.LABEL_DATE: date_index.strftime(yahoo_fin.YAHOO_DATE_FORMAT)
+        , yahoo_fin.LABEL_OPEN: price
+        , yahoo_fin.LABEL_HIGH: price + 0.5
+        , yahoo_fin.LABEL_LOW: price - 0.5
+        , yahoo_fin.LABEL_CLOSE: price
+        , yahoo_fin.LABEL_ADJCLOSE: price
+        , yahoo_fin.LABEL_VOLUME: np.random.randint(1e5, 1e7, len(date_index))
+    }).to_csv(index=False)
+
+def make_bloomberg_page(page_kb):
+    value_dict = {
+        'prev_close': '60.10', 'open_price': '60.20', 'nominal_price': '60.30', 'volume': '12,345,678'
+        , 'marketcap': '1.230T', 'rangeoneday': '59.80 - 60.50', 'range52weeks': '55.00 - 70.00'
+        , 'industry': 'Banks', 'sector': 'Financials', 'next_announce_date': '08/05/2019'
+    }
+    element_list = []
+    for selector in bloomberg_data.BLOOMBERG_SELECTORS:
+        if 'field' not in selector:
+            element_list.append(
+                '<div class="{}"><span>P/E Ratio</span><span class="fieldValue__2d582aa7">12.34</span></div>'.format(selector['class']))
+        elif selector['tag'] == 'section':
+            element_list.append('<section class="{}"><h2>{}</h2><div>{}</div></section>'.format(
+                selector['class'], selector['field'], value_dict[selector['field']]))
+        else:
+            element_list.append('<{0} class="{1}">{2}</{0}>'.format(selector['tag'], selector['class'], value_dict[selector['field']]))
+    return '<html><body>{}{}</body></html>'.format(get_filler(page_kb), ''.join(element_list))
+
+def make_aastocks_page(page_kb, dividend_count=20):
+    row_list = ['<tr><td>Announce Date</td><td>Year Ended</td></tr>']
+    for year in range(2019, 2019 - dividend_count, -1):
+        cell_list = [
+            '{}/03/05'.format(year), '{}/12'.format(year - 1), 'Final Results', 'D:HKD 0.5100', 'Cash'
+            , '{}/05/10'.format(year), '{0}/05/13-{0}/05/14'.format(year), '{}/06/03'.format(year)
+        ]
+        row_list.append('<tr>{}</tr>'.format(''.join('<td class="mcFont">{}</td>'.format(cell) for cell in cell_list)))
+    return '<html><body>{}<table class="{}">{}</table></body></html>'.format(
+        get_filler(page_kb), aastocks_data.AASTOCKS_TABLE_CLASS, ''.join(row_list))
+
+def get_fixture_dict(universe_size, page_kb, fixture_dir=None):
+    '''
+    Get Dict of route and page content in bytes, recorded pages win over synthetic ones
+    '''
+    fixture_dict = {
+        'hkex': make_hkex_page(universe_size, page_kb)
+        , 'yahoo_quote': make_yahoo_quote_page(page_kb)
+        , 'yahoo_welcome': make_yahoo_welcome_page(page_kb)
+        , 'yahoo_hist': make_yahoo_hist_csv()
+        , 'bloomberg': make_bloomberg_page(page_kb)
+        , 'aastocks': make_aastocks_page(page_kb)
+    }
+    fixture_dict = {route: content.encode('utf-8') for route, content in fixture_dict.items()}
+    for route, filename in FIXTURE_FILENAMES.items():
+        if fixture_dir is not None and os.path.exists(os.path.join(fixture_dir, filename)):
+            with open(os.path.join(fixture_dir, filename), 'rb') as fixture_file:
+                fixture_dict[route] = fixture_file.read()
+    return fixture_dict
+
+'''
+Functions of the local fixture server
+'''
+class FixtureServer:
+    '''
+    Local HTTP server of fixture pages in a background thread
+    Parameters
+    ----------
+    fixture_dict : dict
+                   Dict of route and page content in bytes
+    latency : float
+              seconds to wait before each response
+    error_rate : float
+                 fraction of responses replaced by 503
+    '''
+    def __init__(self, fixture_dict, latency = 0.0, error_rate = 0.0):
+        server = self
+        self.fixture_dict = fixture_dict
+        self.latency = latency
+        self.error_rate = error_rate
+
+        class FixtureHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                route = urlsplit(self.path).path.strip('/').split('/')[0]
+                if server.latency > 0:
+                    time.sleep(server.latency)
+                if route not in server.fixture_dict:
+                    self.send_response(404)
+                    content = b''
+                elif random.random() < server.error_rate:
+                    self.send_response(503)
+                    content = b''
+                else:
+                    self.send_response(200)
+                    content = server.fixture_dict[route]
+                if route == 'yahoo_welcome':
+                    self.send_header('Set-Cookie', 'B=benchmark; Path=/')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+        self._httpd.daemon_threads = True
+        self.base_url = 'http://127.0.0.1:{}'.format(self._httpd.server_address[1])
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def point_to_server(base_url, host_rate):
+    '''
+    Point the URLs of every data source at the fixture server
+    '''
+    hkex_list.HKEXNEWS_URL_CHI = base_url + '/hkex'
+    yahoo_fin.YAHOO_QUOTE_URL = base_url + '/yahoo_quote/{}'
+    yahoo_fin.YAHOO_WELCOME_URL = base_url + '/yahoo_welcome/{0}?p={0}'
+    yahoo_fin.YAHOO_HIST_URL = base_url + '/yahoo_hist/{}?period1={}&period2={}&crumb={}'
+    bloomberg_data.BLOOMBERG_QUOTE_URL = base_url + '/bloomberg/{}'
+    aastocks_data.AASTOCKS_DIVIDEND_URL = base_url + '/aastocks/{}'
+    if host_rate is not None:
+        webutil.RATE_LIMITER.set_limit(urlsplit(base_url).netloc, host_rate, int(host_rate))
+
+'''
+Functions of measurement
+'''
+class Recorder:
+    '''
+    Record latency of requests and time of parsing by wrapping module functions
+    '''
+    def __init__(self):
+        self.latency_list = []
+        self.parse_list = []
+        self.status_list = []
+        self._lock = threading.Lock()
+
+    def wrap_request(self, func):
+        def timed_request(*args, **kwargs):
+            start_time = time.perf_counter()
+            response = func(*args, **kwargs)
+            with self._lock:
+                self.latency_list.append(time.perf_counter() - start_time)
+                self.status_list.append(response.status_code)
+            return response
+        return timed_request
+
+    def wrap_parse(self, func):
+        def timed_parse(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.parse_list.append(time.perf_counter() - start_time)
+        return timed_parse
+
+    def install(self):
+        webutil.create_get_request = self.wrap_request(webutil.create_get_request)
+        hkex_list.parse_stock_list = self.wrap_parse(hkex_list.parse_stock_list)
+        yahoo_fin.parse_stock_quote = self.wrap_parse(yahoo_fin.parse_stock_quote)
+        yahoo_fin.convert_hist_dtypes = self.wrap_parse(yahoo_fin.convert_hist_dtypes)
+        bloomberg_data.parse_bloomberg_quote = self.wrap_parse(bloomberg_data.parse_bloomberg_quote)
+        aastocks_data.parse_dividend_cells = self.wrap_parse(aastocks_data.parse_dividend_cells)
+
+def run_target(target, stock_id_list, workers, retry_delay):
+    '''
+    Run a downloader once against the fixture server
+    '''
+    if target == TARGET_HKEX:
+        return hkex_list.download_stocks_df(retry_delay=retry_delay, cache_ttl=None)
+    if target == TARGET_YAHOO_QUOTE:
+        return yahoo_fin.get_stock_quote_df(
+            [yahoo_fin.get_hk_yahoo_code(stock_id) for stock_id in stock_id_list]
+            , max_workers=workers, retry_delay=retry_delay)
+    if target == TARGET_YAHOO_HIST:
+        webutil.get_session(pool_size=workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(
+                lambda stock_id: yahoo_fin.download_yahoo_hist(
+                    yahoo_fin.get_hk_yahoo_code(stock_id), HIST_FROM_DATE, HIST_TO_DATE, retry_delay=retry_delay)
+                , stock_id_list))
+    if target == TARGET_BLOOMBERG:
+        return bloomberg_data.download_bloomberg_df(
+            [bloomberg_data.get_hk_bloomberg_code(stock_id) for stock_id in stock_id_list]
+            , max_workers=workers, retry_delay=retry_delay)
+    if target == TARGET_AASTOCKS:
+        return aastocks_data.download_dividend_hist_df(
+            [aastocks_data.get_hk_aastocks_code(stock_id) for stock_id in stock_id_list]
+            , max_workers=workers, retry_delay=retry_delay, cache_ttl=None)
+    raise ValueError('Unknown target {}'.format(target))
+
+def run_scenario(base_url, target, universe_size, workers, retry_delay, host_rate):
+    '''
+    Run a scenario in the current process, which is a fresh one per scenario
+    Returns
+    -------
+    Dict of metrics
+    '''
+    # Keep the log of the downloaders out of the report, they reset their logger level on every call
+    logging.disable(logging.CRITICAL)
+    point_to_server(base_url, host_rate)
+    recorder = Recorder()
+    recorder.install()
+
+    start_time = time.perf_counter()
+    run_target(target, list(range(1, universe_size + 1)), workers, retry_delay)
+    elapsed = time.perf_counter() - start_time
+
+    latency_array = np.array(recorder.latency_list) * 1000
+    parse_array = np.array(recorder.parse_list) * 1000
+    status_array = np.array(recorder.status_list)
+    return {
+        'target': target
+        , 'universe_size': universe_size
+        , 'workers': workers
+        , 'requests': len(latency_array)
+        , 'errors': int((status_array >= 400).sum()) if len(status_array) > 0 else 0
+        , 'elapsed_s': elapsed
+        , 'requests_per_s': len(latency_array) / elapsed if elapsed > 0 else np.nan
+        , 'p50_ms': np.percentile(latency_array, 50) if len(latency_array) > 0 else np.nan
+        , 'p99_ms': np.percentile(latency_array, 99) if len(latency_array) > 0 else np.nan
+        , 'parse_ms_per_page': parse_array.mean() if len(parse_array) > 0 else np.nan
+        # ru_maxrss is in KB on Linux
+        , 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def run_benchmark(
+    target_list = TARGET_LIST
+    , size_list = [50, 200]
+    , workers_list = [5, 20]
+    , latency = 0.05
+    , error_rate = 0.0
+    , page_kb = 100
+    , fixture_dir = None
+    , retry_delay = 1
+    , host_rate = None
+):
+    '''
+    Run every combination of target, universe size and number of workers
+    Returns
+    -------
+    Pandas DataFrame of metrics per scenario
+    '''
+    result_list = []
+    with FixtureServer(get_fixture_dict(max(size_list), page_kb, fixture_dir), latency, error_rate) as server:
+        # A fresh process per scenario, so that peak RSS and pools are not carried over
+        context = multiprocessing.get_context('spawn')
+        for target in target_list:
+            for universe_size in size_list:
+                for workers in ([1] if target == TARGET_HKEX else workers_list):
+                    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        result_list.append(executor.submit(
+                            run_scenario, server.base_url, target, universe_size, workers, retry_delay, host_rate
+                        ).result())
+    return pd.DataFrame(data=result_list)
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the downloaders against a local fixture server')
+    parser.add_argument('--targets', default=','.join(TARGET_LIST), help='comma separated targets of ' + ', '.join(TARGET_LIST))
+    parser.add_argument('--sizes', default='50,200', help='comma separated universe sizes')
+    parser.add_argument('--workers', default='5,20', help='comma separated numbers of workers')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the server waits before each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of responses replaced by 503')
+    parser.add_argument('--page-kb', type=int, default=100, help='size of filler markup of synthetic pages')
+    parser.add_argument('--fixture-dir', default=None, help='directory of recorded pages, see FIXTURE_FILENAMES')
+    parser.add_argument('--retry-delay', type=float, default=1, help='base delay of retry on injected errors')
+    parser.add_argument('--host-rate', type=float, default=None, help='requests per second allowed by the rate limiter, no limit until the server throttles by default')
+    parser.add_argument('--output', default=None, help='file of the report, CSV or JSON by extension')
+    return parser
+
+### Run as a main program ###
+if __name__ == '__main__':
+    args = get_parser().parse_args()
+    report_df = run_benchmark(
+        target_list=args.targets.split(',')
+        , size_list=[int(size) for size in args.sizes.split(',')]
+        , workers_list=[int(workers) for workers in args.workers.split(',')]
+        , latency=args.latency
+        , error_rate=args.error_rate
+        , page_kb=args.page_kb
+        , fixture_dir=args.fixture_dir
+        , retry_delay=args.retry_delay
+        , host_rate=args.host_rate
+    )
+    pd.set_option('display.width', 200)
+    print(report_df.to_string(index=False, float_format='{:.2f}'.format))
+    if args.output is not None:
+        if args.output.endswith('.json'):
+            report_df.to_json(args.output, orient='records', indent=1)
+        else:
+            report_df.to_csv(args.output, index=False)
@@ -7,21 +7,77 @@ import logutil
 import sys
 
 # modules for downloading and URL
-from bs4 import BeautifulSoup
-from requests.exceptions import RequestException, Timeout
+import parseutil
+import statsutil
 import webutil
 
 # modules for Data Science
 import pandas as pd
 import excelutil
+import frameutil
+import normutil
 
 # modules for concurrency
-import concurrent.futures
-import time
+import asyncutil
+import retryutil
 from datetime import datetime
 
 ### Constant Values ###
 PAGE_TIMEOUT = 5.0
+# Name of the source whose calls in flight are limited adaptively, see retryutil.CONCURRENCY_LIMITER
+BLOOMBERG_SOURCE = 'bloomberg'
+# Seconds during which a quote is served from webutil.MEMORY_CACHE
+BLOOMBERG_QUOTE_CACHE_TTL = 15
+BLOOMBERG_QUOTE_URL = 'https://www.bloomberg.com/quote/{}'
+# Fields of a quote page, extracted in one pass by parseutil.extract_fields
+BLOOMBERG_SELECTORS = [
+    # Previous Close
+    {'field': 'prev_close', 'tag': 'section', 'class': 'dataBox previousclosingpriceonetradingdayago numeric', 'value': parseutil.next_text('div'), 'default': ''}
+    # Open Price
+    , {'field': 'open_price', 'tag': 'section', 'class': 'dataBox openprice numeric', 'value': parseutil.next_text('div'), 'default': ''}
+    # Nominal Price
+    , {'field': 'nominal_price', 'tag': 'span', 'class': 'priceText__1853e8a5', 'value': parseutil.text_of, 'default': ''}
+    # Volume
+    , {'field': 'volume', 'tag': 'section', 'class': 'dataBox volume numeric', 'value': parseutil.next_text('div'), 'default': ''}
+    # Market Cap
+    , {'field': 'marketcap', 'tag': 'section', 'class': 'dataBox marketcap numeric', 'value': parseutil.next_text('div'), 'default': ''}
+    # Range one day
+    , {'field': 'rangeoneday', 'tag': 'section', 'class': 'dataBox rangeoneday', 'value': parseutil.next_text('div'), 'default': ''}
+    # Range 52 weeks
+    , {'field': 'range52weeks', 'tag': 'section', 'class': 'dataBox range52weeks', 'value': parseutil.next_text('div'), 'default': ''}
+    # Industry Category
+    , {'field': 'industry', 'tag': 'div', 'class': 'industry labelText__6f58d7c0', 'value': parseutil.text_of, 'default': ''}
+    # Sector Category
+    , {'field': 'sector', 'tag': 'div', 'class': 'sector labelText__6f58d7c0', 'value': parseutil.text_of, 'default': ''}
+    # Key statistics listed as pairs of label and value
+    , {'key': parseutil.next_text('span'), 'tag': 'div', 'class': 'rowListItemWrap__4121c877', 'value': parseutil.child_text('span', 'fieldValue__2d582aa7')}
+    # Next Announcement Date, only present if announced
+    , {'field': 'next_announce_date', 'tag': 'span', 'class': 'nextAnnouncementDate__0dd98bb1', 'value': parseutil.text_of}
+]
+# Columns of quote results for frameutil.ColumnBuilder, key statistics are added as they appear
+BLOOMBERG_COLUMNS = {
+    'stock_code': None
+    , 'industry': frameutil.DTYPE_CATEGORY
+    , 'sector': frameutil.DTYPE_CATEGORY
+}
+# Field types of quote fields for normutil.normalize_df, key statistics keep their labels
+BLOOMBERG_SCHEMA = {
+    'prev_close': normutil.FIELD_NUMBER
+    , 'open_price': normutil.FIELD_NUMBER
+    , 'nominal_price': normutil.FIELD_NUMBER
+    , 'volume': normutil.FIELD_INTEGER
+    , 'marketcap': normutil.FIELD_SCALED
+    , 'rangeoneday': normutil.FIELD_RANGE
+    , 'range52weeks': normutil.FIELD_RANGE
+    , 'next_announce_date': normutil.FIELD_DATE
+    , 'P/E Ratio': normutil.FIELD_NUMBER
+    , 'Price to Book Ratio': normutil.FIELD_NUMBER
+    , 'Price to Sales Ratio': normutil.FIELD_NUMBER
+    , 'Dividend Indicated Gross Yield': normutil.FIELD_PERCENT
+    , 'Average Volume (30-day)': normutil.FIELD_INTEGER
+    , 'Shares Outstanding': normutil.FIELD_SCALED
+    , 'EPS (TTM)': normutil.FIELD_NUMBER
+}
 
 def get_hk_bloomberg_code(stock_number):
     '''
@@ -29,156 +85,224 @@ def get_hk_bloomberg_code(stock_number):
     '''
     return '{}:HK'.format(stock_number)
 
+@statsutil.timed('parse_seconds', source='bloomberg')
+def parse_bloomberg_quote(decoded_result):
+    '''
+    Parse Bloomberg quote page into dictionary of field name and value
+    Parameters
+    ----------
+    decoded_result : string
+                     HTML content of a Bloomberg quote page
+    Returns
+    -------
+    Dictionary of quote fields
+    '''
+    stock_soup = parseutil.make_soup(decoded_result)
+    return parseutil.extract_fields(stock_soup, BLOOMBERG_SELECTORS)
+
+def parse_bloomberg_content(content):
+    '''
+    Parse Bloomberg quote page in bytes, it runs in a parser process if parse_workers is positive
+    '''
+    with statsutil.STATS.timer('decode_seconds', source='bloomberg'):
+        decoded_result = content.decode('utf-8', 'ignore')
+    if len(decoded_result) <= 0:
+        raise retryutil.ParseError('Failed to retrieve content.')
+    return parse_bloomberg_quote(decoded_result)
+
+def parse_bloomberg_page(stock_code, decoded_result):
+    '''
+    Parse decoded Bloomberg quote page of a stock, the parse function of asyncutil.fetch_all
+    '''
+    return parse_bloomberg_quote(decoded_result)
+
+def fetch_bloomberg_quote(
+    stock_code
+    , proxy_flag=False
+    , timeout=PAGE_TIMEOUT
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+    ):
+    '''
+    Download Bloomberg quote once and raise error if it fails
+    '''
+    logger = logutil.getLogger(__name__)
+
+    proxy_server = None
+    if proxy_flag:
+        proxy_server = webutil.PROXY_POOL.get_proxy()
+        logger.info('download via a proxy server: %s', proxy_server['ip'] + ':' + proxy_server['port'])
+
+    response = webutil.create_get_request(url=BLOOMBERG_QUOTE_URL.format(stock_code), proxy_server=proxy_server, timeout=timeout)
+    if response.status_code != 200:
+        response.raise_for_status()
+    return parseutil.run_parse(parse_bloomberg_content, response.content, parse_workers=parse_workers)
+
 def download_bloomberg_quote(
     stock_code
     , proxy_flag=False
     , retry_time=3
     , retry_delay=10
     , timeout=PAGE_TIMEOUT
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+    , cache_ttl=BLOOMBERG_QUOTE_CACHE_TTL
     ):
-    logger = logutil.getLogger(__name__)
-
+    '''
+    Get Bloomberg quote in format of dictionary by a given stock code.
+    Concurrent calls for the same stock share one download, whose quote is reused within cache_ttl
+    seconds from webutil.MEMORY_CACHE, or downloaded every time if cache_ttl is None.
+    '''
     data_dict = {'stock_code':stock_code}
-    data_url = 'https://www.bloomberg.com/quote/{}'.format(stock_code)
-    for _ in range(retry_time):
-        try:
-            proxy_server = None
-            if proxy_flag:
-                proxy_server = webutil.get_random_proxy()
-                logger.info('download via a proxy server: %s', proxy_server['ip'] + ':' + proxy_server['port'])
-
-            response = webutil.create_get_request(url=data_url, proxy_server=proxy_server, timeout=timeout)
-            if response.status_code != 200:
-                response.raise_for_status()
-            decoded_result = response.content.decode('utf-8', 'ignore')
-            if len(decoded_result) <= 0:
-                logger.error('Failed to retrieve content.')
-                continue
-            stock_soup = BeautifulSoup(decoded_result, 'html.parser')
-
-            # Open Price
-            open_price_section = stock_soup.find('section', {"class": 'dataBox openprice numeric'})
-            open_price = ''
-            if open_price_section is not None:
-                open_price_div = open_price_section.findNext('div')
-                if open_price_div is not None:
-                    open_price = open_price_div.get_text()
-            # Previous Close
-            prev_close_section = stock_soup.find('section', {"class": 'dataBox previousclosingpriceonetradingdayago numeric'})
-            prev_close = ''
-            if prev_close_section is not None:
-                prev_close_div = prev_close_section.findNext('div')
-                if prev_close_div is not None:
-                    prev_close = prev_close_div.get_text()
-            # Volume
-            volume_section = stock_soup.find('section', {"class": 'dataBox volume numeric'})
-            volume = ''
-            if volume_section is not None:
-                volume_div = volume_section.findNext('div')
-                if volume_div is not None:
-                    volume = volume_div.get_text()                
-            # Market Cap
-            marketcap_section = stock_soup.find('section', {"class": 'dataBox marketcap numeric'})
-            marketcap = ''
-            if marketcap_section is not None:
-                marketcap_div = marketcap_section.findNext('div')
-                if marketcap_div is not None:
-                    marketcap = marketcap_div.get_text()                
-            # Range one day
-            rangeoneday_section = stock_soup.find('section', {"class": 'dataBox rangeoneday'})
-            rangeoneday = ''
-            if rangeoneday_section is not None:
-                rangeoneday_div = rangeoneday_section.findNext('div')
-                if rangeoneday_div is not None:
-                    rangeoneday = rangeoneday_div.get_text()
-            # Range 52 weeks
-            range52weeks_section = stock_soup.find('section', {"class": 'dataBox range52weeks'})
-            range52weeks = ''
-            if range52weeks_section is not None:
-                range52weeks_div = range52weeks_section.findNext('div')
-                if range52weeks_div is not None:
-                    range52weeks = range52weeks_div.get_text()
-
-            # Industry Category
-            industry_div = stock_soup.find('div', {"class": 'industry labelText__6f58d7c0'})
-            industry = ''
-            if industry_div is not None:
-                industry = industry_div.get_text()
-            # Sector Category
-            sector_div = stock_soup.find('div', {"class": 'sector labelText__6f58d7c0'})
-            sector = ''
-            if sector_div is not None:
-                sector = sector_div.get_text()
-            # Nominal Price
-            nominal_price_div = stock_soup.find('span', {"class": 'priceText__1853e8a5'})
-            nominal_price = ''
-            if nominal_price_div is not None:
-                nominal_price = nominal_price_div.get_text()
-
-            data_dict.update({
-                'prev_close': prev_close
-                , 'open_price': open_price
-                , 'nominal_price': nominal_price
-                , 'volume': volume
-                , 'marketcap': marketcap
-                , 'rangeoneday': rangeoneday
-                , 'range52weeks': range52weeks
-                , 'industry': industry
-                , 'sector': sector
-            })
-
-            div_list = stock_soup.findAll('div', {"class": 'rowListItemWrap__4121c877'})
-            for div in div_list or []:
-                key_str = div.findNext('span').get_text()
-                val_str = div.find('span', {"class": 'fieldValue__2d582aa7'}).get_text()
-                data_dict.update(
-                    {
-                        key_str: val_str
-                    }
-                )
-
-            next_announce_date_span = stock_soup.find('span', {'class': 'nextAnnouncementDate__0dd98bb1'})
-            if next_announce_date_span is not None:
-                next_announce_date = next_announce_date_span.get_text()
-                data_dict.update({'next_announce_date': next_announce_date})
-            break
-        except Timeout:
-            logger.error('socket timed out - URL %s', data_url)
-            time.sleep(retry_delay)
-        except RequestException as error:
-            logger.error('Data not retrieved because %s\nURL: %s', error, data_url)
-            time.sleep(retry_delay)
-        except Exception as error:
-            logger.error('Unexpected error of %s\nURL: %s', error, data_url)
-            time.sleep(retry_delay)            
+    download_quote = lambda: retryutil.call_with_retry(
+        lambda: fetch_bloomberg_quote(stock_code, proxy_flag=proxy_flag, timeout=timeout, parse_workers=parse_workers)
+        , key=stock_code
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+    ).value
+    if cache_ttl is None:
+        quote_dict = download_quote()
     else:
-        logger.error('No response after %d retry.' % retry_time)
+        quote_dict = webutil.MEMORY_CACHE.get(BLOOMBERG_SOURCE, stock_code, download_quote, cache_ttl)
+    data_dict.update(quote_dict or {})
     return data_dict
 
+def iter_bloomberg_quotes(
+    stock_code_list
+    , max_workers=10
+    , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , callback=None
+    , checkpoint=None
+    , adaptive=False
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+    ):
+    '''
+    Yield Bloomberg quote in format of dictionary as soon as each stock completes
+    Parameters
+    ----------
+    callback : function
+               function of (retryutil.RetryResult, number of completed stocks, number of stocks)
+               called for every stock before its quote is yielded
+    checkpoint : checkpoint.Checkpoint
+                 stocks completed in it are not downloaded again, and every stock is saved in it as it completes
+    adaptive : boolean
+               Whether calls in flight are limited by retryutil.CONCURRENCY_LIMITER of the source up to max_workers
+    parse_workers : int
+                    number of parser processes shared by the download threads, 0 parses in the threads
+    Returns
+    -------
+    generator of stock quote in format of dictionary
+    '''
+    # Size the shared connection pools to the number of threads
+    webutil.get_session(pool_size=max_workers)
+    for result in retryutil.iter_batch(
+        lambda stock_code: fetch_bloomberg_quote(stock_code, proxy_flag=proxy_flag, timeout=timeout, parse_workers=parse_workers)
+        , stock_code_list
+        , max_workers=max_workers
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+        , callback=callback
+        , checkpoint=checkpoint
+        , concurrency=retryutil.CONCURRENCY_LIMITER.get_concurrency(BLOOMBERG_SOURCE) if adaptive else None
+    ):
+        data_dict = {'stock_code':result.key}
+        data_dict.update(result.value or {})
+        yield data_dict
+
 def download_bloomberg_df(
     stock_code_list
     , max_workers=10
     , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , return_status=False
+    , checkpoint=None
+    , adaptive=False
+    , normalize=False
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
     ):
+    '''
+    Get Data Frame of Bloomberg quotes by a list of stock codes
+    Parameters
+    ----------
+    return_status : boolean
+                    Whether a Data Frame of attempts and final status per stock is returned as well
+    checkpoint : checkpoint.Checkpoint
+                 stocks completed in it are not downloaded again, see retryutil.iter_batch
+    adaptive : boolean
+               Whether calls in flight are limited by retryutil.CONCURRENCY_LIMITER of the source up to max_workers
+    normalize : boolean
+                Whether quote fields are converted into numbers by BLOOMBERG_SCHEMA, ranges into low and high
+    parse_workers : int
+                    number of parser processes shared by the download threads, 0 parses in the threads
+    Returns
+    -------
+    Data Frame of stock quotes, or a tuple of it and the status Data Frame
+    '''
     logger = logutil.getLogger(__name__)
 
-    stock_quote_list = []   
+    result_list = []
     # Threads start and it takes quite a long time due to multiple network I/O
     logger.info('It starts to download stock quotes. Please wait.')
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_stock_code = {
-            executor.submit(download_bloomberg_quote, stock_code, proxy_flag): 
-            stock_code for stock_code in stock_code_list
-        }
-
-    # Update thread status for monitoring
-    for future in concurrent.futures.as_completed(future_to_stock_code):
-        stock_quote_list.append(future.result())
+    stock_quote_builder = frameutil.ColumnBuilder(BLOOMBERG_COLUMNS)
+    stock_quote_builder.extend(iter_bloomberg_quotes(
+        stock_code_list
+        , max_workers=max_workers
+        , proxy_flag=proxy_flag
+        , retry_time=retry_time
+        , retry_delay=retry_delay
+        , timeout=timeout
+        , callback=lambda result, completed_count, total_count: result_list.append(result)
+        , checkpoint=checkpoint
+        , adaptive=adaptive
+        , parse_workers=parse_workers
+    ))
     
     logger.info('Downloading stock quotes completed.')
-    return pd.DataFrame(
-        data=stock_quote_list
-        ).set_index('stock_code', append=False)
+    stock_quote_df = stock_quote_builder.to_df().set_index('stock_code', append=False)
+    if normalize:
+        stock_quote_df = normutil.normalize_df(stock_quote_df, BLOOMBERG_SCHEMA)
+    if return_status:
+        return stock_quote_df, retryutil.get_status_df(result_list)
+    return stock_quote_df
+
+async def download_bloomberg_df_async(
+    stock_code_list
+    , concurrency=asyncutil.DEFAULT_CONCURRENCY
+    , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , normalize=False
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+    ):
+    '''
+    Asyncio counterpart of download_bloomberg_df running up to concurrency requests at the same time
+    '''
+    logger = logutil.getLogger(__name__)
+
+    logger.info('It starts to download stock quotes. Please wait.')
+    result_list = await asyncutil.fetch_all(
+        [(stock_code, BLOOMBERG_QUOTE_URL.format(stock_code)) for stock_code in stock_code_list]
+        , parse_bloomberg_page
+        , concurrency=concurrency
+        , proxy_flag=proxy_flag
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+        , timeout=timeout
+        , parse_workers=parse_workers
+    )
+
+    stock_quote_builder = frameutil.ColumnBuilder(BLOOMBERG_COLUMNS)
+    for result in result_list:
+        data_dict = {'stock_code':result.key}
+        data_dict.update(result.value or {})
+        stock_quote_builder.append(data_dict)
+
+    logger.info('Downloading stock quotes completed.')
+    stock_quote_df = stock_quote_builder.to_df().set_index('stock_code', append=False)
+    if normalize:
+        stock_quote_df = normutil.normalize_df(stock_quote_df, BLOOMBERG_SCHEMA)
+    return stock_quote_df
 
 ### Run as a main program ###
 if __name__ == '__main__':
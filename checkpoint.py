@@ -0,0 +1,120 @@
+'''
+Module of checkpoints of batch downloads in SQLite keyed by run id, source and stock code
+Results are saved as they arrive, so that a rerun of the same run id fetches only
+the stocks which are missing or failed. A finished run drops its results.
+'''
+# core modules
+import pickle
+import sqlite3
+from contextlib import contextmanager
+
+# modules for concurrency
+import retryutil
+
+# modules for date time
+from datetime import datetime
+
+### Constant Values ###
+DEFAULT_DB_FILENAME = 'checkpoint.sqlite'
+RUN_ID_FORMAT = '%Y%m%d%H%M%S'
+
+def create_run_id():
+    '''
+    Create a run id from the current time
+    '''
+    return datetime.now().strftime(RUN_ID_FORMAT)
+
+@contextmanager
+def connect(db_path = DEFAULT_DB_FILENAME):
+    '''
+    Connect to the checkpoint database, creating its tables if needed.
+    It commits on success, rolls back on error, and always closes.
+    '''
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoint ('
+                'run_id TEXT, source TEXT, key TEXT, status TEXT, attempts INTEGER, value BLOB, saved_at TEXT'
+                ', PRIMARY KEY (run_id, source, key))'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS run (run_id TEXT PRIMARY KEY, started_at TEXT, finished_at TEXT)')
+            yield conn
+    finally:
+        conn.close()
+
+def start_run(run_id, db_path = DEFAULT_DB_FILENAME):
+    '''
+    Record a run as started, or as unfinished again if it is continued
+    '''
+    with connect(db_path) as conn:
+        conn.execute('INSERT OR IGNORE INTO run (run_id, started_at) VALUES (?, ?)', (run_id, datetime.now().isoformat(timespec='seconds')))
+        conn.execute('UPDATE run SET finished_at = NULL WHERE run_id = ?', (run_id,))
+
+def finish_run(run_id, db_path = DEFAULT_DB_FILENAME):
+    '''
+    Record a run as finished and delete its results, which are not resumed any more
+    '''
+    with connect(db_path) as conn:
+        conn.execute('DELETE FROM checkpoint WHERE run_id = ?', (run_id,))
+        conn.execute('UPDATE run SET finished_at = ? WHERE run_id = ?', (datetime.now().isoformat(timespec='seconds'), run_id))
+
+def get_latest_run_id(db_path = DEFAULT_DB_FILENAME):
+    '''
+    Get the id of the latest unfinished run, None if there is none
+    '''
+    with connect(db_path) as conn:
+        row = conn.execute('SELECT run_id FROM run WHERE finished_at IS NULL ORDER BY started_at DESC, run_id DESC LIMIT 1').fetchone()
+    return None if row is None else row[0]
+
+class Checkpoint:
+    '''
+    Checkpoint of the results of a data source in a run
+    Parameters
+    ----------
+    run_id : string
+             id of the run, see create_run_id
+    source : string
+             name of the data source, as stock codes of different sources may collide
+    db_path : string
+              path of the SQLite database
+    '''
+    def __init__(self, run_id, source, db_path = DEFAULT_DB_FILENAME):
+        self.run_id = run_id
+        self.source = source
+        self.db_path = db_path
+
+    def save(self, result):
+        '''
+        Save a final retryutil.RetryResult, replacing the one of an earlier attempt of the run
+        '''
+        value = pickle.dumps(result.value, protocol=pickle.HIGHEST_PROTOCOL) if result.status == retryutil.STATUS_SUCCESS else None
+        with connect(self.db_path) as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO checkpoint (run_id, source, key, status, attempts, value, saved_at) VALUES (?, ?, ?, ?, ?, ?, ?)'
+                , (self.run_id, self.source, str(result.key), result.status, result.attempts, value, datetime.now().isoformat(timespec='seconds'))
+            )
+
+    def load(self):
+        '''
+        Load the successful results of the run
+        Returns
+        -------
+        Dict of key and retryutil.RetryResult
+        '''
+        with connect(self.db_path) as conn:
+            row_list = conn.execute(
+                'SELECT key, attempts, value FROM checkpoint WHERE run_id = ? AND source = ? AND status = ?'
+                , (self.run_id, self.source, retryutil.STATUS_SUCCESS)
+            ).fetchall()
+        return {
+            key: retryutil.RetryResult(key, value=pickle.loads(value), attempts=attempts, status=retryutil.STATUS_SUCCESS)
+            for key, attempts, value in row_list
+        }
+
+    def clear(self):
+        '''
+        Delete every result of the source in the run
+        '''
+        with connect(self.db_path) as conn:
+            conn.execute('DELETE FROM checkpoint WHERE run_id = ? AND source = ?', (self.run_id, self.source))
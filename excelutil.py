@@ -7,6 +7,9 @@ import pandas as pd
 # modules for handling files
 import base64
 import io
+import os
+import tempfile
+import xlsxwriter
 
 ### Constant Values ###
 LABEL_DATAFRAME = 'dataframe'
@@ -90,3 +93,289 @@ def save_multi_worksheet_file(
             save_index = (LABEL_SAVE_INDEX in dict_df) and dict_df[LABEL_SAVE_INDEX]
             obj_df.to_excel(writer, encoding='utf-8', sheet_name=sheet_name, index=save_index)
         writer.save()
+
+'''
+Functions of streaming Excel export
+Peak memory is bounded by chunk size instead of workbook size:
+rows are written one by one in constant_memory mode and base64 is encoded chunk by chunk.
+'''
+# Number of rows converted at once when a DataFrame is streamed
+DEFAULT_CHUNK_ROWS = 10000
+# Number of bytes encoded at once in Base64, a multiple of 3 so that chunks join without padding
+BASE64_CHUNK_BYTES = 3 * 256 * 1024
+DEFAULT_DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+def iter_row_chunks(data, chunk_rows=DEFAULT_CHUNK_ROWS):
+    '''
+    Yield DataFrame chunks from a DataFrame or an iterator of DataFrame chunks
+    '''
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, len(data), chunk_rows):
+            yield data.iloc[start:start + chunk_rows]
+    else:
+        for chunk in data:
+            yield chunk
+
+def get_cell_value(value):
+    '''
+    Convert a value of DataFrame into one which xlsxwriter writes natively, None for blank
+    '''
+    if value is None or (not isinstance(value, str) and pd.isna(value) is True):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, 'item'):
+        # numpy scalar
+        return value.item()
+    return value
+
+def write_worksheet_stream(
+    workbook
+    , data
+    , sheetname='Sheet1'
+    , save_index=True
+    , chunk_rows=DEFAULT_CHUNK_ROWS
+):
+    '''
+    Write a DataFrame or an iterator of DataFrame chunks into a new worksheet row by row
+    '''
+    worksheet = workbook.add_worksheet(sheetname)
+    row_num = 0
+    for chunk in iter_row_chunks(data, chunk_rows):
+        if save_index:
+            chunk = chunk.reset_index()
+        if row_num == 0:
+            worksheet.write_row(0, 0, [
+                ' '.join(str(name) for name in column) if isinstance(column, tuple) else str(column)
+                for column in chunk.columns
+            ])
+            row_num = 1
+        for row in chunk.itertuples(index=False, name=None):
+            for col_num, value in enumerate(row):
+                cell_value = get_cell_value(value)
+                if cell_value is not None:
+                    worksheet.write(row_num, col_num, cell_value)
+            row_num += 1
+
+def save_multi_worksheet_file_stream(
+    list_df = []
+    , filepath = 'data.xlsx'
+    , chunk_rows = DEFAULT_CHUNK_ROWS
+):
+    '''
+    This function is to save multiple worksheets into an Excel file with bounded memory.
+    Parameters
+    ----------
+    list_df : List of Dict with Pandas DataFrame as well as Worksheet Name (LABEL_DATAFRAME, LABEL_SHEETNAME, LABEL_SAVE_INDEX)
+         Data Content of the Excel, LABEL_DATAFRAME may be an iterator of DataFrame chunks
+    filepath: Path or binary stream of saved Excel file
+    chunk_rows: Number of rows converted at once when a DataFrame is given
+    '''
+    workbook = xlsxwriter.Workbook(filepath, {
+        'constant_memory': True
+        , 'default_date_format': DEFAULT_DATE_FORMAT
+    })
+    try:
+        for dict_df in list_df:
+            write_worksheet_stream(
+                workbook
+                , dict_df[LABEL_DATAFRAME]
+                , sheetname=dict_df[LABEL_SHEETNAME]
+                , save_index=(LABEL_SAVE_INDEX in dict_df) and dict_df[LABEL_SAVE_INDEX]
+                , chunk_rows=chunk_rows
+            )
+    finally:
+        workbook.close()
+
+def save_excel_file_stream(
+    data
+    , filepath='data.xlsx'
+    , sheetname='Sheet1'
+    , save_index=True
+    , chunk_rows=DEFAULT_CHUNK_ROWS
+):
+    '''
+    Save a DataFrame or an iterator of DataFrame chunks into an Excel file with bounded memory
+    '''
+    save_multi_worksheet_file_stream(
+        [{LABEL_DATAFRAME: data, LABEL_SHEETNAME: sheetname, LABEL_SAVE_INDEX: save_index}]
+        , filepath
+        , chunk_rows
+    )
+
+def encode_base64_stream(input_stream, output):
+    '''
+    Encode a binary stream in Base64 chunk by chunk into a file path or a stream
+    '''
+    output_stream = open(output, 'wb') if isinstance(output, str) else output
+    try:
+        is_text = isinstance(output_stream, io.TextIOBase)
+        while True:
+            chunk = input_stream.read(BASE64_CHUNK_BYTES)
+            if not chunk:
+                break
+            b64 = base64.b64encode(chunk)
+            output_stream.write(b64.decode('ascii') if is_text else b64)
+    finally:
+        if isinstance(output, str):
+            output_stream.close()
+
+def save_multi_worksheet_base64_stream(
+    list_df = []
+    , output = 'data.xlsx.b64'
+    , chunk_rows = DEFAULT_CHUNK_ROWS
+):
+    '''
+    This function is to write multiple worksheets as an Excel in Base64 encoding with bounded memory.
+    Parameters
+    ----------
+    list_df : List of Dict with Pandas DataFrame as well as Worksheet Name (LABEL_DATAFRAME, LABEL_SHEETNAME, LABEL_SAVE_INDEX)
+         Data Content of the Excel, LABEL_DATAFRAME may be an iterator of DataFrame chunks
+    output: Path of the Base64 file, or a text or binary stream to write into
+    chunk_rows: Number of rows converted at once when a DataFrame is given
+    '''
+    # The workbook goes to a temporary file rather than memory
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = os.path.join(temp_dir, 'data.xlsx')
+        save_multi_worksheet_file_stream(list_df, temp_path, chunk_rows)
+        with open(temp_path, 'rb') as xlsx_file:
+            encode_base64_stream(xlsx_file, output)
+
+def save_excel_base64_stream(
+    data
+    , output='data.xlsx.b64'
+    , sheetname='Sheet1'
+    , save_index=True
+    , chunk_rows=DEFAULT_CHUNK_ROWS
+):
+    '''
+    Write a DataFrame or an iterator of DataFrame chunks as an Excel in Base64 encoding with bounded memory
+    '''
+    save_multi_worksheet_base64_stream(
+        [{LABEL_DATAFRAME: data, LABEL_SHEETNAME: sheetname, LABEL_SAVE_INDEX: save_index}]
+        , output
+        , chunk_rows
+    )
+
+'''
+Functions of dispatching output formats
+Parquet, Feather and compressed CSV are much faster to write and read back than Excel.
+A list of DataFrame goes to one Excel file with a worksheet each,
+or to a directory with one file per sheet name for the other formats.
+'''
+FORMAT_EXCEL = 'xlsx'
+FORMAT_PARQUET = 'parquet'
+FORMAT_FEATHER = 'feather'
+FORMAT_CSV = 'csv.gz'
+FORMAT_LIST = [FORMAT_EXCEL, FORMAT_PARQUET, FORMAT_FEATHER, FORMAT_CSV]
+
+def get_format(filepath):
+    '''
+    Get output format by file extension, None if it is not supported
+    '''
+    for file_format in FORMAT_LIST:
+        if filepath.endswith('.' + file_format):
+            return file_format
+    return None
+
+def get_sheet_path(dirpath, sheetname, file_format):
+    '''
+    Get path of the file of a sheet in a directory of multiple tables
+    '''
+    return os.path.join(dirpath, '{}.{}'.format(sheetname, file_format))
+
+def save_df(
+    df
+    , filepath
+    , file_format=None
+    , sheetname='Sheet1'
+    , save_index=True
+):
+    '''
+    Save DataFrame into a file of the given format
+    Parameters
+    ----------
+    df : Pandas DataFrame
+    filepath : Path of saved file
+    file_format : One of FORMAT_LIST, by extension of filepath if None
+    sheetname : Worksheet name, only used by Excel
+    save_index : Whether the index is saved as well
+    '''
+    file_format = file_format or get_format(filepath)
+    if file_format == FORMAT_EXCEL:
+        save_excel_file(df, filepath, sheetname, save_index)
+    elif file_format == FORMAT_PARQUET:
+        df.to_parquet(filepath, index=save_index)
+    elif file_format == FORMAT_FEATHER:
+        # Feather stores columns only, the index becomes columns
+        (df.reset_index() if save_index else df.reset_index(drop=True)).to_feather(filepath)
+    elif file_format == FORMAT_CSV:
+        df.to_csv(filepath, index=save_index, compression='gzip')
+    else:
+        raise ValueError('Unsupported output format of {}: {}'.format(filepath, file_format))
+
+def read_df(
+    filepath
+    , file_format=None
+    , sheetname=0
+):
+    '''
+    Read DataFrame from a file of the given format, the reverse of save_df
+    '''
+    file_format = file_format or get_format(filepath)
+    if file_format == FORMAT_EXCEL:
+        return pd.read_excel(filepath, sheet_name=sheetname)
+    elif file_format == FORMAT_PARQUET:
+        return pd.read_parquet(filepath)
+    elif file_format == FORMAT_FEATHER:
+        return pd.read_feather(filepath)
+    elif file_format == FORMAT_CSV:
+        return pd.read_csv(filepath, compression='gzip')
+    else:
+        raise ValueError('Unsupported output format of {}: {}'.format(filepath, file_format))
+
+def save_multi_df(
+    list_df = []
+    , path = 'data.xlsx'
+    , file_format = None
+):
+    '''
+    This function is to save multiple DataFrame as one Excel file or a directory of files.
+    Parameters
+    ----------
+    list_df : List of Dict with Pandas DataFrame as well as Worksheet Name (LABEL_DATAFRAME, LABEL_SHEETNAME, LABEL_SAVE_INDEX)
+         Data Content of the tables
+    path: Path of saved Excel file, or directory of files named by sheet name for the other formats
+    file_format : One of FORMAT_LIST, by extension of path if None
+    '''
+    file_format = file_format or get_format(path)
+    if file_format == FORMAT_EXCEL:
+        save_multi_worksheet_file(list_df, path)
+        return
+    os.makedirs(path, exist_ok=True)
+    for dict_df in list_df:
+        save_df(
+            dict_df[LABEL_DATAFRAME]
+            , get_sheet_path(path, dict_df[LABEL_SHEETNAME], file_format)
+            , file_format=file_format
+            , save_index=(LABEL_SAVE_INDEX in dict_df) and dict_df[LABEL_SAVE_INDEX]
+        )
+
+def read_multi_df(
+    path
+    , file_format = None
+):
+    '''
+    Read multiple DataFrame saved by save_multi_df
+    Returns
+    -------
+    Dict of sheet name and Pandas DataFrame
+    '''
+    file_format = file_format or get_format(path)
+    if file_format == FORMAT_EXCEL:
+        return pd.read_excel(path, sheet_name=None)
+    suffix = '.' + file_format
+    return {
+        filename[:-len(suffix)]: read_df(os.path.join(path, filename), file_format)
+        for filename in sorted(os.listdir(path)) if filename.endswith(suffix)
+    }
@@ -0,0 +1,83 @@
+'''
+Utility module of building DataFrame from results of batch downloads
+Records are appended into per-column lists instead of a list of dict,
+and the DataFrame is built once with compact dtypes declared by a schema.
+'''
+# modules for Data Science
+import pandas as pd
+
+### Constant Values ###
+# Compact dtypes of a schema
+DTYPE_CATEGORY = 'category'
+DTYPE_FLOAT32 = 'float32'
+DTYPE_INT32 = 'int32'
+
+def to_dtype(values, dtype):
+    '''
+    Convert a list or Series of values into a Series of the dtype, None leaves it as it is
+    '''
+    if dtype is None:
+        # An empty column has no values to infer its dtype from
+        return pd.Series(values, dtype=None if len(values) > 0 else object)
+    if dtype == DTYPE_CATEGORY:
+        return pd.Series(values, dtype=DTYPE_CATEGORY)
+    if dtype == DTYPE_FLOAT32:
+        return pd.to_numeric(pd.Series(values), errors='coerce').astype(DTYPE_FLOAT32)
+    if dtype == DTYPE_INT32:
+        series = pd.to_numeric(pd.Series(values), errors='coerce')
+        # Missing values need the nullable integer
+        return series.astype('Int32' if series.isna().any() else DTYPE_INT32)
+    return pd.Series(values).astype(dtype)
+
+def apply_schema(df, schema):
+    '''
+    Convert the columns of a DataFrame which are in the schema into their compact dtypes
+    '''
+    return df.assign(**{
+        column: to_dtype(df[column], dtype).values
+        for column, dtype in schema.items() if column in df.columns
+    })
+
+class ColumnBuilder:
+    '''
+    Accumulator of records in per-column lists
+    Parameters
+    ----------
+    schema : dict
+             Dict of column name and dtype such as DTYPE_CATEGORY, DTYPE_FLOAT32 or DTYPE_INT32.
+             Columns of the schema come first, other keys of records are added in order of appearance
+    '''
+    def __init__(self, schema = None):
+        self.schema = dict(schema or {})
+        self._column_dict = {column: [] for column in self.schema}
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, record):
+        '''
+        Append a record in format of dictionary, missing keys are None
+        '''
+        for key in record:
+            if key not in self._column_dict:
+                self._column_dict[key] = [None] * self._length
+        for key, values in self._column_dict.items():
+            values.append(record.get(key))
+        self._length += 1
+
+    def extend(self, record_iter):
+        '''
+        Append every record of an iterable, such as a generator of a batch download
+        '''
+        for record in record_iter:
+            self.append(record)
+
+    def to_df(self):
+        '''
+        Build the DataFrame with dtypes of the schema
+        '''
+        return pd.DataFrame({
+            column: to_dtype(values, self.schema.get(column))
+            for column, values in self._column_dict.items()
+        }, index=pd.RangeIndex(self._length))
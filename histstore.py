@@ -0,0 +1,204 @@
+'''
+Module of local store of historical prices which is refreshed incrementally
+'''
+# core modules
+import logutil
+import json
+import os
+
+# modules for downloading and URL
+import webutil
+import yahoo_fin
+
+# modules for Data Science
+import pandas as pd
+
+# modules for concurrency
+import retryutil
+import threading
+from datetime import datetime, timedelta
+
+### Constant Values ###
+DEFAULT_STORE_DIR = 'hist_store'
+DEFAULT_FROM_DATE = '2000-01-01'
+CATALOG_FILENAME = 'catalog.json'
+# Calendar days of stored history downloaded again to detect split or dividend adjustment
+OVERLAP_DAYS = 10
+# Relative difference of Adj Close regarded as a rewrite of history
+ADJCLOSE_TOLERANCE = 1e-4
+# Actions taken by an update
+ACTION_FULL = 'full'
+ACTION_APPEND = 'append'
+ACTION_REWRITE = 'rewrite'
+ACTION_NONE = 'none'
+
+def get_timestamp(date_str):
+    return int(round(datetime.strptime(date_str, yahoo_fin.YAHOO_DATE_FORMAT).timestamp()))
+
+class HistStore:
+    '''
+    Local store of historical prices, one Parquet file per stock code,
+    with a catalog of the last stored date of every stock code.
+    '''
+    def __init__(self, store_dir = DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+        self._catalog = self._read_catalog()
+
+    def _get_catalog_path(self):
+        return os.path.join(self.store_dir, CATALOG_FILENAME)
+
+    def _read_catalog(self):
+        catalog_path = self._get_catalog_path()
+        if not os.path.exists(catalog_path):
+            return {}
+        with open(catalog_path, 'r') as catalog_file:
+            return json.load(catalog_file)
+
+    def _write_catalog(self):
+        # Replace the catalog atomically so that a crash never leaves half a file
+        catalog_path = self._get_catalog_path()
+        with open(catalog_path + '.tmp', 'w') as catalog_file:
+            json.dump(self._catalog, catalog_file, indent=0, sort_keys=True)
+        os.replace(catalog_path + '.tmp', catalog_path)
+
+    def get_path(self, stock_code):
+        '''
+        Get path of the Parquet file of a stock code
+        '''
+        return os.path.join(self.store_dir, stock_code + '.parquet')
+
+    def get_last_date(self, stock_code):
+        '''
+        Get the last stored date in yyyy-mm-dd format, None if the stock code is not stored
+        '''
+        with self._lock:
+            return self._catalog.get(stock_code)
+
+    def read_hist(self, stock_code):
+        '''
+        Read stored historical prices indexed by Date, None if the stock code is not stored
+        '''
+        file_path = self.get_path(stock_code)
+        if not os.path.exists(file_path):
+            return None
+        return pd.read_parquet(file_path)
+
+    def write_hist(self, stock_code, df):
+        '''
+        Replace stored historical prices of a stock code and record its last date
+        '''
+        file_path = self.get_path(stock_code)
+        df.to_parquet(file_path + '.tmp')
+        os.replace(file_path + '.tmp', file_path)
+        with self._lock:
+            self._catalog[stock_code] = df.index.max().strftime(yahoo_fin.YAHOO_DATE_FORMAT)
+            self._write_catalog()
+
+def is_adjusted(stored_df, new_df):
+    '''
+    Check whether Adj Close of the overlapping dates has changed, which means a split or dividend adjustment
+    '''
+    overlap_index = stored_df.index.intersection(new_df.index)
+    if len(overlap_index) <= 0:
+        # Nothing to compare, regard it as rewritten to be safe
+        return True
+    stored_adjclose = stored_df.loc[overlap_index, yahoo_fin.LABEL_ADJCLOSE].astype('float64')
+    new_adjclose = new_df.loc[overlap_index, yahoo_fin.LABEL_ADJCLOSE].astype('float64')
+    difference = ((new_adjclose - stored_adjclose).abs() / stored_adjclose.abs().clip(lower=1e-9)).max()
+    return bool(difference > ADJCLOSE_TOLERANCE)
+
+def fetch_hist(stock_code, from_date, to_date, proxy_flag=False, timeout=yahoo_fin.PAGE_TIMEOUT):
+    '''
+    Download historical prices once and raise error if it fails
+    '''
+    return yahoo_fin.convert_hist_dtypes(
+        yahoo_fin.fetch_yahoo_hist(
+            stock_code
+            , get_timestamp(from_date)
+            , get_timestamp(to_date)
+            , proxy_flag=proxy_flag
+            , timeout=timeout
+        )
+    )
+
+def update_hist(
+    hist_store
+    , stock_code
+    , to_date=datetime.now().strftime(yahoo_fin.YAHOO_DATE_FORMAT)
+    , proxy_flag=False
+    , timeout=yahoo_fin.PAGE_TIMEOUT
+):
+    '''
+    Download only the missing tail of historical prices of a stock code and append it to the store.
+    The whole history is downloaded again if Adj Close of stored dates has changed.
+    Parameters
+    ----------
+    hist_store : HistStore
+                 Local store of historical prices
+    stock_code : string
+                 Stock Code in Yahoo! Finance format
+    to_date: string
+             Ending Date in yyyy-mm-dd format
+    Returns
+    -------
+    Action taken, one of ACTION_FULL, ACTION_APPEND, ACTION_REWRITE and ACTION_NONE
+    '''
+    logger = logutil.getLogger(__name__)
+
+    last_date = hist_store.get_last_date(stock_code)
+    stored_df = hist_store.read_hist(stock_code) if last_date is not None else None
+    if stored_df is None:
+        hist_store.write_hist(stock_code, fetch_hist(stock_code, DEFAULT_FROM_DATE, to_date, proxy_flag=proxy_flag, timeout=timeout))
+        return ACTION_FULL
+    if last_date >= to_date:
+        return ACTION_NONE
+
+    overlap_date = (
+        datetime.strptime(last_date, yahoo_fin.YAHOO_DATE_FORMAT) - timedelta(days=OVERLAP_DAYS)
+        ).strftime(yahoo_fin.YAHOO_DATE_FORMAT)
+    tail_df = fetch_hist(stock_code, overlap_date, to_date, proxy_flag=proxy_flag, timeout=timeout)
+    if is_adjusted(stored_df, tail_df):
+        logger.info('History of %s has been adjusted since %s, download it again.', stock_code, overlap_date)
+        hist_store.write_hist(stock_code, fetch_hist(stock_code, DEFAULT_FROM_DATE, to_date, proxy_flag=proxy_flag, timeout=timeout))
+        return ACTION_REWRITE
+
+    new_df = tail_df[tail_df.index > stored_df.index.max()]
+    if len(new_df) <= 0:
+        return ACTION_NONE
+    hist_store.write_hist(stock_code, pd.concat([stored_df, new_df]))
+    return ACTION_APPEND
+
+def update_hist_store(
+    stock_code_list
+    , store_dir=DEFAULT_STORE_DIR
+    , to_date=datetime.now().strftime(yahoo_fin.YAHOO_DATE_FORMAT)
+    , max_workers=10
+    , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=yahoo_fin.PAGE_TIMEOUT
+):
+    '''
+    Refresh the local store of historical prices of a list of stock codes concurrently
+    Returns
+    -------
+    Pandas DataFrame of action, attempts and final status per stock code
+    '''
+    logger = logutil.getLogger(__name__)
+
+    hist_store = HistStore(store_dir)
+    logger.info('It starts to update historical prices. Please wait.')
+    # Size the shared connection pools to the number of threads
+    webutil.get_session(pool_size=max_workers)
+    result_list = retryutil.run_batch(
+        lambda stock_code: update_hist(hist_store, stock_code, to_date=to_date, proxy_flag=proxy_flag, timeout=timeout)
+        , stock_code_list
+        , max_workers=max_workers
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+    )
+    logger.info('Updating historical prices completed.')
+    status_df = retryutil.get_status_df(result_list)
+    status_df['action'] = [result.value for result in result_list]
+    return status_df
@@ -6,21 +6,26 @@ import re
 import logutil
 
 # modules for downloading and URL
-from bs4 import BeautifulSoup
-from requests.exceptions import RequestException, Timeout
+import parseutil
+import statsutil
 import webutil
 
 # modules for Data Science
 import pandas as pd
 import excelutil
+import stockstore
 
 # modules for concurrency
-import time
+import retryutil
 
 ### Constant Values ###
 DEFAULT_EXCEL_FILENAME = 'stock_list.xlsx'
 HKEXNEWS_URL_CHI = 'http://www.hkexnews.hk/hyperlink/hyperlist_c.HTM'
+HKEX_LIST_TR_CLASS_LIST = ["ms-rteTableOddRow-BlueTable_CHI", "ms-rteTableEvenRow-BlueTable_CHI"]
+HKEX_LIST_TR_STRAINER = parseutil.make_strainer("tr", {"class": HKEX_LIST_TR_CLASS_LIST})
 PAGE_TIMEOUT = 5.0
+# Seconds during which the cached stock list is used without revalidation
+HKEX_LIST_CACHE_TTL = 12 * 3600
 
 # Get Stock Dict from TD tag object crawled
 def get_stock_dict(td_list):
@@ -43,6 +48,62 @@ def get_stock_dict(td_list):
         , 'url': td_list[2].get_text().strip()
     }
 
+# Parse the stock list page and output the list of given processer format
+@statsutil.timed('parse_seconds', source='hkex_list')
+def parse_stock_list(content, td_processor=get_stock_dict):
+    '''
+    Parse the content of stock list page
+    Parameters
+    ----------
+    content : bytes
+              content of the stock list page
+    td_processor : function
+                   function converting the list of Table TD into a stock record
+    Returns
+    -------
+    list of stock records
+    '''
+    decoded_result = content.decode('utf-8', 'ignore')
+    if len(decoded_result) <= 0:
+        raise retryutil.ParseError('Failed to retrieve content.')
+    # Create a BeautifulSoup object of the stock rows only
+    soup = parseutil.make_soup(decoded_result, parse_only=HKEX_LIST_TR_STRAINER)
+    # Search by CSS Selector
+    tr_list = soup.findAll("tr", {"class": HKEX_LIST_TR_CLASS_LIST})
+    return [td_processor(tr.findAll("td")) for tr in tr_list]
+
+# Download the stock list from HKex website once
+def fetch_stock_list(
+        td_processor=get_stock_dict
+        , proxy_flag=False
+        , timeout=PAGE_TIMEOUT
+        , cache_ttl=HKEX_LIST_CACHE_TTL
+    ):
+    '''
+    Download the stock list once and raise error if it fails.
+    The page goes through webutil.RESPONSE_CACHE unless cache_ttl is None.
+    '''
+    logger = logutil.getLogger(__name__)
+
+    proxy_server = None
+    if proxy_flag:
+        proxy_server = webutil.PROXY_POOL.get_proxy()
+        logger.info('download via a proxy server: %s', proxy_server['ip'] + ':' + proxy_server['port'])
+
+    if cache_ttl is None:
+        response = webutil.create_get_request(url=HKEXNEWS_URL_CHI, proxy_server=proxy_server, timeout=timeout)
+        if response.status_code != 200:
+            response.raise_for_status()
+        return parse_stock_list(response.content, td_processor)
+    return webutil.RESPONSE_CACHE.get_parsed(
+        HKEXNEWS_URL_CHI
+        , lambda content: parse_stock_list(content, td_processor)
+        , cache_ttl
+        , parser_name=webutil.get_func_name(parse_stock_list) + ':' + webutil.get_func_name(td_processor)
+        , proxy_server=proxy_server
+        , timeout=timeout
+    )
+
 # Get Stock List from HKex website and output the list of given processer format    
 def download_stock_list(
         td_processor=get_stock_dict
@@ -50,49 +111,19 @@ def download_stock_list(
         , retry_time=3
         , retry_delay=10
         , timeout=PAGE_TIMEOUT
+        , cache_ttl=HKEX_LIST_CACHE_TTL
     ):
-    # Define the destination URL
-    hkex_list_url = HKEXNEWS_URL_CHI
-    hkex_list_tr_class_list = ["ms-rteTableOddRow-BlueTable_CHI", "ms-rteTableEvenRow-BlueTable_CHI"]
-    
     # Section of downloading stock list
     logger = logutil.getLogger(__name__)
     logger.info('It starts to download stock list. Please wait.')
-    tr_list = []
-    for _ in range(retry_time):
-        try:
-            proxy_server = None
-            if proxy_flag:
-                proxy_server = webutil.get_random_proxy()
-                logger.info('download via a proxy server: %s', proxy_server['ip'] + ':' + proxy_server['port'])
-
-            response = webutil.create_get_request(url=hkex_list_url, proxy_server=proxy_server, timeout=timeout)
-            if response.status_code != 200:
-                response.raise_for_status()
-            decoded_result = response.content.decode('utf-8', 'ignore')
-            if len(decoded_result) <= 0:
-                logger.error('Failed to retrieve content.')
-                continue                
-            # Create a BeautifulSoup object
-            soup = BeautifulSoup(decoded_result, 'html.parser')
-            # Search by CSS Selector
-            tr_list = soup.findAll("tr", {"class": hkex_list_tr_class_list})
-            break
-        except Timeout:
-            logger.error('socket timed out - URL %s', hkex_list_url)
-            time.sleep(retry_delay)
-        except RequestException as error:
-            logger.error('Data not retrieved because %s\nURL: %s', error, hkex_list_url)
-            time.sleep(retry_delay)
-        except Exception as error:
-            logger.error('Unexpected error of %s\nURL: %s', error, hkex_list_url)
-            time.sleep(retry_delay)
-    else:
-        logger.error('No response after %d retry.' % retry_time)
-    logger.info('Downloading stock list completed with length of %d.', len(tr_list))
-
-    # Prepare list of stock triple from list of table TR objects
-    return [td_processor(tr.findAll("td")) for tr in tr_list ]
+    result = retryutil.call_with_retry(
+        lambda: fetch_stock_list(td_processor=td_processor, proxy_flag=proxy_flag, timeout=timeout, cache_ttl=cache_ttl)
+        , key=HKEXNEWS_URL_CHI
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+    )
+    stock_list = result.value or []
+    logger.info('Downloading stock list completed with length of %d.', len(stock_list))
+    return stock_list
 
 # Get Stock List from HKex website and output DataFrame format    
 def download_stocks_df(
@@ -100,6 +131,7 @@ def download_stocks_df(
     , retry_time=3
     , retry_delay=10
     , timeout=PAGE_TIMEOUT    
+    , cache_ttl=HKEX_LIST_CACHE_TTL
 ):
     return pd.DataFrame(
         data=download_stock_list(
@@ -107,6 +139,7 @@ def download_stocks_df(
             , retry_time=retry_time
             , retry_delay=retry_delay
             , timeout=timeout
+            , cache_ttl=cache_ttl
         )
     ).set_index('stock_id', append=False)
 
@@ -125,29 +158,56 @@ def save_excel_file(
 
 # init stock list database by downloading
 def init_stock_list(
-    filepath=DEFAULT_EXCEL_FILENAME
+    filepath=stockstore.DEFAULT_DB_FILENAME
     , proxy_flag=False
     , retry_time=3
     , retry_delay=10
     , timeout=PAGE_TIMEOUT    
+    , excel_filepath=None
 ):
-    # Prepare DataFrame object from the list of stock dict
-    save_excel_file(
-        download_stocks_df(
+    '''
+    Download the stock list and refresh the local stock list store by its difference
+    Parameters
+    ----------
+    filepath : string
+               path of the SQLite stock list store, an .xlsx path is taken as excel_filepath
+               for the calls made before the store, which keeps its default path then
+    excel_filepath : string
+                     path of an Excel file to export the refreshed list to, no export if None
+    Returns
+    -------
+    Dict of change kind (listed, delisted, updated) and number of stocks
+    '''
+    if filepath.endswith('.xlsx'):
+        # The Excel file used to be the stock list, read_stock_list reads it as Excel
+        excel_filepath = excel_filepath or filepath
+        filepath = stockstore.DEFAULT_DB_FILENAME
+    stock_store = stockstore.StockListStore(filepath)
+    change_dict = stock_store.refresh(
+        download_stock_list(
             proxy_flag=proxy_flag
             , retry_time=retry_time
             , retry_delay=retry_delay
             , timeout=timeout
         )
-        , filepath
     )
+    if excel_filepath is not None:
+        save_excel_file(stock_store.read_df(), excel_filepath)
+    return change_dict
 
-# read stock list database by local Excel
-def read_stock_list(filepath=DEFAULT_EXCEL_FILENAME, sheetname='hkex_stocks'):
+# read stock list database by local store
+def read_stock_list(filepath=stockstore.DEFAULT_DB_FILENAME, sheetname='hkex_stocks'):
     _filepath = filepath
     if filepath is None:
-        _filepath = DEFAULT_EXCEL_FILENAME
-    return pd.read_excel(filepath, sheet_name=sheetname).set_index('stock_id', append=False)
+        _filepath = stockstore.DEFAULT_DB_FILENAME
+    if _filepath.endswith('.xlsx'):
+        # Excel file exported before
+        return pd.read_excel(_filepath, sheet_name=sheetname).set_index('stock_id', append=False)
+    return stockstore.StockListStore(_filepath, create_flag=False).read_df()
+
+# get stock information by Stock ID from local store
+def get_stock(stock_id, filepath=stockstore.DEFAULT_DB_FILENAME):
+    return stockstore.StockListStore(filepath, create_flag=False).get_stock(stock_id)
 
 ### Run as a main program ###
 if __name__ == '__main__':
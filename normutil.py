@@ -0,0 +1,105 @@
+'''
+Utility module of normalizing scraped text fields into typed columns
+Every conversion works on a whole column with vectorized string operations.
+A schema is a dict of column name and field type; absent columns are ignored
+and unparsable values such as 'N/A' or '--' become missing values.
+'''
+# modules for Data Science
+import pandas as pd
+
+### Constant Values ###
+# Field types of a schema
+FIELD_NUMBER = 'number'
+FIELD_INTEGER = 'integer'
+FIELD_SCALED = 'scaled'
+FIELD_PERCENT = 'percent'
+FIELD_RANGE = 'range'
+FIELD_DATE = 'date'
+# Multipliers of abbreviated large numbers such as 1.23B
+SCALE_DICT = {'': 1.0, 'K': 1e3, 'M': 1e6, 'B': 1e9, 'T': 1e12}
+# Suffixes of the columns split from a range
+LABEL_LOW = '_low'
+LABEL_HIGH = '_high'
+
+NUMBER_PATTERN = r'([-+]?(?:\d[\d,]*)?\.?\d+)'
+SCALED_PATTERN = r'^\s*' + NUMBER_PATTERN + r'\s*([KMBTkmbt]?)'
+RANGE_PATTERN = r'^\s*' + NUMBER_PATTERN + r'\s*-\s*' + NUMBER_PATTERN
+
+def to_number(series):
+    '''
+    Convert text such as '1,234.5' into float64
+    '''
+    text = series.astype('string').str.replace(',', '', regex=False).str.strip()
+    return pd.to_numeric(text, errors='coerce').astype('float64')
+
+def to_integer(series):
+    '''
+    Convert text such as '12,345,678' into nullable Int64, as volumes may be missing
+    '''
+    return to_number(series).round().astype('Int64')
+
+def to_scaled(series):
+    '''
+    Convert abbreviated text such as '1.23B' or '456.7M' into float64
+    '''
+    parts = series.astype('string').str.extract(SCALED_PATTERN)
+    multiplier = parts[1].str.upper().map(SCALE_DICT).astype('float64')
+    return to_number(parts[0]) * multiplier
+
+def to_percent(series):
+    '''
+    Convert text such as '+1.23%' into float64 in percent
+    '''
+    return to_number(series.astype('string').str.replace('%', '', regex=False))
+
+def to_range(series):
+    '''
+    Split text such as '10.20 - 12.40' into a DataFrame of low and high in float64
+    '''
+    parts = series.astype('string').str.extract(RANGE_PATTERN)
+    return pd.DataFrame({
+        LABEL_LOW: to_number(parts[0])
+        , LABEL_HIGH: to_number(parts[1])
+    }, index=series.index)
+
+def to_date(series):
+    '''
+    Convert text of date into datetime64
+    '''
+    return pd.to_datetime(series, errors='coerce')
+
+CONVERTER_DICT = {
+    FIELD_NUMBER: to_number
+    , FIELD_INTEGER: to_integer
+    , FIELD_SCALED: to_scaled
+    , FIELD_PERCENT: to_percent
+    , FIELD_DATE: to_date
+}
+
+def normalize_df(df, schema):
+    '''
+    Convert text columns of a DataFrame into typed columns by a schema
+    Parameters
+    ----------
+    df : Pandas DataFrame
+         DataFrame of scraped text fields
+    schema : dict
+             Dict of column name and field type, a range column is replaced by its low and high columns
+    Returns
+    -------
+    New Pandas DataFrame with typed columns
+    '''
+    column_dict = {}
+    for column in df.columns:
+        field_type = schema.get(column)
+        if field_type is None:
+            column_dict[column] = df[column]
+        elif field_type == FIELD_RANGE:
+            range_df = to_range(df[column])
+            column_dict[column + LABEL_LOW] = range_df[LABEL_LOW]
+            column_dict[column + LABEL_HIGH] = range_df[LABEL_HIGH]
+        elif field_type in CONVERTER_DICT:
+            column_dict[column] = CONVERTER_DICT[field_type](df[column])
+        else:
+            raise ValueError('Unknown field type of {}: {}'.format(column, field_type))
+    return pd.DataFrame(column_dict, index=df.index)
@@ -0,0 +1,220 @@
+'''
+Utility module of HTML parsing
+'''
+# core modules
+import atexit
+import statsutil
+
+# modules for parsing HTML
+from bs4 import BeautifulSoup, SoupStrainer
+try:
+    import lxml
+    DEFAULT_PARSER = 'lxml'
+except ImportError:
+    # Fall back to the parser of Python standard library
+    DEFAULT_PARSER = 'html.parser'
+
+# modules for concurrency
+import concurrent.futures
+import multiprocessing
+import threading
+import time
+
+### Constant Values ###
+# Number of parser processes, 0 parses in the calling thread
+DEFAULT_PARSE_WORKERS = 0
+
+def make_strainer(name=None, attrs={}, **kwargs):
+    '''
+    Create a SoupStrainer which limits tree building to the matched elements and their subtrees
+    Parameters
+    ----------
+    name : string or list
+           tag names to keep
+    attrs : dict
+            attributes which the kept tags must have
+    Returns
+    -------
+    SoupStrainer object
+    '''
+    return SoupStrainer(name, attrs, **kwargs)
+
+def make_soup(markup, parse_only=None, features=None):
+    '''
+    Create a BeautifulSoup object with lxml if it is installed, otherwise html.parser
+    Parameters
+    ----------
+    markup : string or bytes
+             HTML content
+    parse_only : SoupStrainer
+                 only the matched elements are built into the tree if it is given
+    features : string
+               parser to use instead of DEFAULT_PARSER
+    Returns
+    -------
+    BeautifulSoup object
+    '''
+    return BeautifulSoup(markup, features or DEFAULT_PARSER, parse_only=parse_only)
+
+'''
+Functions of declarative field extraction
+A selector is a dict of
+    'tag' : tag name to match
+    'class' : space separated classes which the tag must all have, among others like BeautifulSoup.find
+    'value' : function of the matched tag returning the value, None if not found
+    'field' : name of the field, the first match wins
+    'default' : value of the field if it is not found; the field is absent without a default
+    'key' : function of the matched tag returning the field name, instead of 'field';
+            every match adds a field and a later one wins
+'''
+def text_of(tag):
+    '''
+    Get text of the tag itself
+    '''
+    return tag.get_text()
+
+def next_text(name):
+    '''
+    Get function returning text of the next element of the given name after a tag
+    '''
+    def get_next_text(tag):
+        next_tag = tag.findNext(name)
+        return None if next_tag is None else next_tag.get_text()
+    return get_next_text
+
+def child_text(name, class_name=None):
+    '''
+    Get function returning text of the first child element of the given name and class of a tag
+    '''
+    def get_child_text(tag):
+        child_tag = tag.find(name, {"class": class_name}) if class_name is not None else tag.find(name)
+        return None if child_tag is None else child_tag.get_text()
+    return get_child_text
+
+def extract_fields(soup_object, selector_list):
+    '''
+    Extract every field of a selector table by walking the document once
+    Parameters
+    ----------
+    soup_object : BeautifulSoup
+                  parsed document
+    selector_list : list
+                    list of selector dict
+    Returns
+    -------
+    Dictionary of field name and value
+    '''
+    # Index selectors by tag name so that each element is only checked against its own selectors
+    selector_dict = {}
+    for selector in selector_list:
+        selector_dict.setdefault(selector['tag'], []).append((frozenset(selector.get('class', '').split()), selector))
+
+    data_dict = {
+        selector['field']: selector['default']
+        for selector in selector_list if 'field' in selector and 'default' in selector
+    }
+    found_set = set()
+    for tag in soup_object.find_all(True):
+        tag_selector_list = selector_dict.get(tag.name)
+        if tag_selector_list is None:
+            continue
+        class_attr = tag.get('class')
+        class_set = set(class_attr) if isinstance(class_attr, list) else set((class_attr or '').split())
+        for selector_class_set, selector in tag_selector_list:
+            if not selector_class_set <= class_set:
+                continue
+            if 'field' in selector:
+                if selector['field'] in found_set:
+                    continue
+                value = selector['value'](tag)
+                if value is not None:
+                    data_dict[selector['field']] = value
+                    found_set.add(selector['field'])
+            else:
+                key = selector['key'](tag)
+                value = selector['value'](tag)
+                if key is not None and value is not None:
+                    data_dict[key] = value
+    return data_dict
+
+'''
+Functions of the parser process pool
+Parsing holds the GIL, so threads which download pages hand the content to parser processes
+and receive only the small extracted results.
+'''
+_parse_pool = None
+_parse_pool_workers = 0
+_parse_pool_lock = threading.Lock()
+_parse_pool_atexit = False
+
+def get_parse_pool(parse_workers):
+    '''
+    Get the process-wide pool of parser processes, recreated larger if more workers are asked for
+    '''
+    global _parse_pool, _parse_pool_workers, _parse_pool_atexit
+    with _parse_pool_lock:
+        if not _parse_pool_atexit:
+            # Callers other than stock_stat seldom close the pool, do it for them at exit
+            atexit.register(close_parse_pool)
+            _parse_pool_atexit = True
+        if _parse_pool is None or parse_workers > _parse_pool_workers:
+            old_pool = _parse_pool
+            # Spawned processes do not inherit locks held by the download threads
+            _parse_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=parse_workers
+                , mp_context=multiprocessing.get_context('spawn')
+            )
+            _parse_pool_workers = parse_workers
+            if old_pool is not None:
+                # Parses already submitted to the old pool still complete
+                old_pool.shutdown(wait=False)
+        return _parse_pool
+
+def discard_parse_pool(parse_pool):
+    '''
+    Forget a broken pool, unless it has been replaced already
+    '''
+    global _parse_pool, _parse_pool_workers
+    with _parse_pool_lock:
+        if _parse_pool is parse_pool:
+            _parse_pool = None
+            _parse_pool_workers = 0
+    parse_pool.shutdown(wait=False)
+
+def close_parse_pool():
+    '''
+    Shut the parser processes down, the next get_parse_pool starts new ones
+    '''
+    global _parse_pool, _parse_pool_workers
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=True)
+        _parse_pool = None
+        _parse_pool_workers = 0
+
+def run_parse(parse_func, *args, parse_workers = DEFAULT_PARSE_WORKERS):
+    '''
+    Run a parse function in the calling thread, or in the parser process pool if parse_workers is positive
+    Parameters
+    ----------
+    parse_func : function
+                 module level function, so that it can be pickled, whose result is small
+    parse_workers : int
+                    number of parser processes
+    Returns
+    -------
+    result of parse_func, errors are raised in the calling thread
+    '''
+    if not parse_workers:
+        return parse_func(*args)
+    start_time = time.perf_counter()
+    parse_pool = get_parse_pool(parse_workers)
+    try:
+        return parse_pool.submit(parse_func, *args).result()
+    except concurrent.futures.process.BrokenProcessPool:
+        # A parser process died, the next attempt starts a new pool
+        discard_parse_pool(parse_pool)
+        raise
+    finally:
+        # Timings inside the parser processes stay there, record the round trip instead
+        statsutil.STATS.observe('parse_pool_seconds', time.perf_counter() - start_time, func=getattr(parse_func, '__name__', ''))
@@ -0,0 +1,131 @@
+'''
+Utility module of running stages of a download pipeline concurrently
+A stage starts as soon as the stages it depends on have completed,
+so independent data sources run at the same time instead of one after another.
+'''
+# core modules
+import logutil
+
+# modules for concurrency
+import retryutil
+import statsutil
+import concurrent.futures
+import time
+
+class Stage:
+    '''
+    A stage of a pipeline
+    Parameters
+    ----------
+    name : string
+           unique name of the stage
+    func : function
+           function of (Dict of dependency name and its value, number of workers) returning the value of the stage
+    depends : list
+              names of the stages whose values are required
+    '''
+    def __init__(self, name, func, depends = ()):
+        self.name = name
+        self.func = func
+        self.depends = list(depends)
+
+def get_stage_depth(stage_list):
+    '''
+    Get Dict of stage name and its depth, the length of the longest chain of dependencies before it
+    '''
+    stage_dict = {stage.name: stage for stage in stage_list}
+    depth_dict = {}
+    def get_depth(name, visiting):
+        if name in depth_dict:
+            return depth_dict[name]
+        if name in visiting:
+            raise ValueError('Stage {} depends on itself'.format(name))
+        if name not in stage_dict:
+            raise ValueError('Unknown stage {}'.format(name))
+        depends = stage_dict[name].depends
+        depth = 0 if len(depends) <= 0 else 1 + max(get_depth(depend, visiting | {name}) for depend in depends)
+        depth_dict[name] = depth
+        return depth
+    for stage in stage_list:
+        get_depth(stage.name, frozenset())
+    return depth_dict
+
+def get_stage_workers(stage_list, max_workers):
+    '''
+    Split the worker budget evenly among the stages of the same depth, which usually run at the same time
+    '''
+    depth_dict = get_stage_depth(stage_list)
+    depth_count = {}
+    for depth in depth_dict.values():
+        depth_count[depth] = depth_count.get(depth, 0) + 1
+    return {
+        name: max(1, max_workers // depth_count[depth])
+        for name, depth in depth_dict.items()
+    }
+
+def iter_pipeline(stage_list, max_workers = 20):
+    '''
+    Run every stage once its dependencies have completed and yield each result as soon as it is final.
+    A stage is not run if any of its dependencies has failed.
+    Parameters
+    ----------
+    stage_list : list
+                 list of Stage
+    max_workers : int
+                  number of download workers shared by all stages
+    Returns
+    -------
+    generator of retryutil.RetryResult keyed by stage name in order of completion
+    '''
+    logger = logutil.getLogger(__name__)
+
+    workers_dict = get_stage_workers(stage_list, max_workers)
+    pending_list = list(stage_list)
+    value_dict = {}
+    failed_set = set()
+    future_to_stage = {}
+    # A thread per stage only waits on the workers of the stage, the budget is enforced by each stage
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(stage_list)))
+
+    def run_stage(stage, inputs):
+        start_time = time.time()
+        with statsutil.STATS.timer('stage_seconds', stage=stage.name):
+            value = stage.func(inputs, workers_dict[stage.name])
+        logger.info('Stage %s completed in %.1f seconds.', stage.name, time.time() - start_time)
+        return value
+
+    try:
+        while pending_list or future_to_stage:
+            for stage in list(pending_list):
+                if any(depend in failed_set for depend in stage.depends):
+                    pending_list.remove(stage)
+                    failed_set.add(stage.name)
+                    logger.error('Stage %s is skipped due to failed dependencies.', stage.name)
+                    yield retryutil.RetryResult(stage.name, error=RuntimeError('Dependencies failed'))
+                elif all(depend in value_dict for depend in stage.depends):
+                    pending_list.remove(stage)
+                    logger.info('Stage %s starts with %d workers.', stage.name, workers_dict[stage.name])
+                    inputs = {depend: value_dict[depend] for depend in stage.depends}
+                    future_to_stage[executor.submit(run_stage, stage, inputs)] = stage
+            if not future_to_stage:
+                continue
+
+            done_set, _ = concurrent.futures.wait(
+                future_to_stage
+                , return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done_set:
+                stage = future_to_stage.pop(future)
+                result = retryutil.RetryResult(stage.name, attempts=1)
+                try:
+                    result.value = future.result()
+                    result.status = retryutil.STATUS_SUCCESS
+                    value_dict[stage.name] = result.value
+                except Exception as error:
+                    result.error_class = retryutil.classify_error(error)
+                    result.error = error
+                    failed_set.add(stage.name)
+                    logger.error('Stage %s failed: %s', stage.name, error)
+                yield result
+    finally:
+        executor.shutdown(wait=True)
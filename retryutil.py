@@ -0,0 +1,531 @@
+'''
+Utility module of retrying failed downloads
+'''
+# core modules
+import logutil
+import heapq
+import statsutil
+import random
+import socket
+import threading
+
+# modules for downloading and URL
+from requests.exceptions import RequestException, Timeout
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# modules for Data Science
+import pandas as pd
+
+# modules for concurrency
+import asyncio
+import collections
+import concurrent.futures
+import time
+
+### Constant Values ###
+# Error classes which have their own retry policy
+ERROR_TIMEOUT = 'timeout'
+ERROR_THROTTLE = 'throttle'
+ERROR_AUTH = 'auth'
+ERROR_HTTP = 'http'
+ERROR_NETWORK = 'network'
+ERROR_PARSE = 'parse'
+# Final status of a download
+STATUS_SUCCESS = 'success'
+STATUS_FAILED = 'failed'
+# Longest wait between two attempts in seconds
+MAX_RETRY_DELAY = 60.0
+# Initial, lowest and highest number of calls in flight to a source under adaptive control
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 50
+# Calls added to the limit per round of limit successful calls, and factor applied on timeout or 429
+CONCURRENCY_INCREASE = 1.0
+CONCURRENCY_DECREASE = 0.5
+# Latency is healthy up to this factor of its long-run average, and so is the error rate up to this
+CONCURRENCY_LATENCY_FACTOR = 2.0
+CONCURRENCY_ERROR_RATE = 0.1
+# Weight of the latest call in the short-run and the long-run moving averages
+CONCURRENCY_FAST_ALPHA = 0.3
+CONCURRENCY_SLOW_ALPHA = 0.02
+# Seconds a batch waits at most before trying again for a slot freed by another batch of the source
+CONCURRENCY_POLL_TIME = 0.1
+
+class ParseError(Exception):
+    '''
+    Error raised when a downloaded page does not have the expected content
+    '''
+    pass
+
+class RetryPolicy:
+    '''
+    Retry policy of an error class: number of attempts and exponential backoff with jitter.
+    The n-th retry waits base_delay * multiplier ** (n - 1), capped by max_delay,
+    of which the jitter fraction is randomized.
+    '''
+    def __init__(
+        self
+        , max_attempts = 3
+        , base_delay = 1.0
+        , multiplier = 2.0
+        , max_delay = MAX_RETRY_DELAY
+        , jitter = 0.5
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def get_delay(self, attempts):
+        '''
+        Get seconds to wait after the given number of failed attempts
+        '''
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** max(attempts - 1, 0))
+        return delay * (1 - self.jitter) + random.uniform(0, delay * self.jitter)
+
+class RetryResult:
+    '''
+    Result of a download with its number of attempts and final status
+    '''
+    def __init__(self, key, value = None, attempts = 0, status = STATUS_FAILED, error_class = None, error = None):
+        self.key = key
+        self.value = value
+        self.attempts = attempts
+        self.status = status
+        self.error_class = error_class
+        self.error = error
+
+    def to_dict(self):
+        return {
+            'key': self.key
+            , 'attempts': self.attempts
+            , 'status': self.status
+            , 'error_class': self.error_class
+            , 'error': None if self.error is None else str(self.error)
+        }
+
+def get_default_policies(retry_time = 3, retry_delay = 10):
+    '''
+    Get retry policies of every error class
+    Parameters
+    ----------
+    retry_time : int
+                 maximum number of attempts of a download
+    retry_delay : int
+                  base delay of retry when the site throttles or fails (429/5xx)
+    Returns
+    -------
+    Dict of error class and RetryPolicy
+    '''
+    return {
+        ERROR_TIMEOUT: RetryPolicy(max_attempts=retry_time, base_delay=1.0)
+        , ERROR_NETWORK: RetryPolicy(max_attempts=retry_time, base_delay=1.0)
+        , ERROR_THROTTLE: RetryPolicy(max_attempts=retry_time, base_delay=retry_delay)
+        # 401/403 may be cured by a new session token or another proxy
+        , ERROR_AUTH: RetryPolicy(max_attempts=min(retry_time, 2), base_delay=0.5)
+        # A page which cannot be parsed seldom changes on the next attempt
+        , ERROR_PARSE: RetryPolicy(max_attempts=min(retry_time, 2), base_delay=0.5)
+        # Other client errors such as 404 never change on the next attempt
+        , ERROR_HTTP: RetryPolicy(max_attempts=1)
+    }
+
+def get_status_code(error):
+    '''
+    Get HTTP status code of an error of requests or aiohttp, None if it is not an HTTP error
+    '''
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) is not None:
+        return response.status_code
+    return getattr(error, 'status', None)
+
+def classify_error(error):
+    '''
+    Classify an error into ERROR_TIMEOUT, ERROR_THROTTLE, ERROR_AUTH, ERROR_HTTP, ERROR_NETWORK or ERROR_PARSE
+    '''
+    if isinstance(error, (Timeout, asyncio.TimeoutError, socket.timeout)):
+        return ERROR_TIMEOUT
+    status_code = get_status_code(error)
+    if isinstance(status_code, int):
+        if status_code == 429 or status_code >= 500:
+            return ERROR_THROTTLE
+        if status_code in (401, 403):
+            return ERROR_AUTH
+        return ERROR_HTTP
+    if isinstance(error, RequestException):
+        return ERROR_NETWORK
+    if aiohttp is not None and isinstance(error, aiohttp.ClientError):
+        return ERROR_NETWORK
+    # Anything else goes wrong while handling the content
+    return ERROR_PARSE
+
+def log_failure(key, attempts, error_class, error):
+    logger = logutil.getLogger(__name__)
+    logger.error('Attempt %d of %s failed with %s error: %s', attempts, key, error_class, error)
+
+def handle_failure(result, error, policies):
+    '''
+    Record a failed attempt in the result
+    Returns
+    -------
+    Seconds to wait before the next attempt, None if no more attempt is allowed
+    '''
+    error_class = classify_error(error)
+    result.error_class = error_class
+    result.error = error
+    log_failure(result.key, result.attempts, error_class, error)
+    statsutil.STATS.increment('attempt_failures_total', error_class=error_class)
+    policy = policies.get(error_class) or RetryPolicy()
+    if result.attempts >= policy.max_attempts:
+        logutil.getLogger(__name__).error('No response of %s after %d attempts.', result.key, result.attempts)
+        statsutil.STATS.increment('retries_exhausted_total', error_class=error_class)
+        return None
+    delay = policy.get_delay(result.attempts)
+    # The backoff is a sleep in call_with_retry and fetch_parse, a delay in the queue of iter_batch
+    statsutil.STATS.increment('retries_total', error_class=error_class)
+    statsutil.STATS.observe('retry_delay_seconds', delay, error_class=error_class)
+    return delay
+
+class AdaptiveConcurrency:
+    '''
+    Limit of calls in flight to a source by additive increase and multiplicative decrease (AIMD).
+    The limit grows by CONCURRENCY_INCREASE every round of limit successful calls while latency and
+    error rate stay healthy, and is cut by CONCURRENCY_DECREASE on timeout or throttling.
+    Calls sent before a cut fail alike, so the limit is cut at most once per round trip.
+    Every batch of the source takes its slots from the same limit.
+    '''
+    def __init__(
+        self
+        , source
+        , initial = DEFAULT_INITIAL_CONCURRENCY
+        , min_limit = DEFAULT_MIN_CONCURRENCY
+        , max_limit = DEFAULT_MAX_CONCURRENCY
+    ):
+        self.source = source
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self._latency = None
+        self._baseline = None
+        self._error_rate = 0.0
+        self._decreased = 0.0
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._set_gauges()
+
+    def _set_gauges(self):
+        statsutil.STATS.set_gauge('concurrency_limit', self.get_limit(), source=self.source)
+        statsutil.STATS.set_gauge('concurrency_in_flight', self.in_flight, source=self.source)
+
+    def get_limit(self):
+        '''
+        Get the number of calls allowed in flight
+        '''
+        return max(self.min_limit, int(self.limit))
+
+    def set_range(self, min_limit = None, max_limit = None):
+        '''
+        Set the lowest and the highest limit, keeping the current limit within them
+        '''
+        with self._lock:
+            self.min_limit = min_limit or self.min_limit
+            self.max_limit = max_limit or self.max_limit
+            self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+            self._set_gauges()
+            self._condition.notify_all()
+
+    def report(self, seconds, error_class = None):
+        '''
+        Adjust the limit by the duration and the error class of a finished call, None if it succeeded
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self._error_rate += CONCURRENCY_FAST_ALPHA * ((error_class is not None) - self._error_rate)
+            if error_class in (ERROR_TIMEOUT, ERROR_THROTTLE):
+                if now - self._decreased >= (self._latency or seconds):
+                    self.limit = max(self.min_limit, self.limit * CONCURRENCY_DECREASE)
+                    self._decreased = now
+                    statsutil.STATS.increment('concurrency_decreases_total', source=self.source, error_class=error_class)
+            elif error_class is None:
+                if self._latency is None:
+                    self._latency = self._baseline = seconds
+                else:
+                    self._latency += CONCURRENCY_FAST_ALPHA * (seconds - self._latency)
+                    self._baseline += CONCURRENCY_SLOW_ALPHA * (seconds - self._baseline)
+                if self._latency <= self._baseline * CONCURRENCY_LATENCY_FACTOR and self._error_rate <= CONCURRENCY_ERROR_RATE:
+                    self.limit = min(self.max_limit, self.limit + CONCURRENCY_INCREASE / self.limit)
+            self._set_gauges()
+            self._condition.notify_all()
+
+    def try_acquire(self):
+        '''
+        Take a slot of a call in flight without waiting
+        Returns
+        -------
+        True if a slot is taken, which call or release gives back
+        '''
+        with self._lock:
+            if self.in_flight >= self.get_limit():
+                return False
+            self.in_flight += 1
+            self._set_gauges()
+            return True
+
+    def release(self):
+        '''
+        Give back a slot taken by try_acquire
+        '''
+        with self._lock:
+            self.in_flight -= 1
+            self._set_gauges()
+            self._condition.notify_all()
+
+    def wait(self, timeout = None):
+        '''
+        Wait until a slot is free or timeout seconds pass
+        '''
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < self.get_limit(), timeout)
+
+    def call(self, func, *args):
+        '''
+        Call a function in a slot taken by try_acquire, reporting its duration and error if any,
+        and give back the slot
+        '''
+        start_time = time.monotonic()
+        try:
+            value = func(*args)
+        except Exception as error:
+            self.report(time.monotonic() - start_time, classify_error(error))
+            raise
+        else:
+            self.report(time.monotonic() - start_time)
+            return value
+        finally:
+            self.release()
+
+class ConcurrencyLimiter:
+    '''
+    Per-source AdaptiveConcurrency shared by every fetcher
+    '''
+    def __init__(
+        self
+        , initial = DEFAULT_INITIAL_CONCURRENCY
+        , min_limit = DEFAULT_MIN_CONCURRENCY
+        , max_limit = DEFAULT_MAX_CONCURRENCY
+    ):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._concurrency_dict = {}
+        self._lock = threading.Lock()
+
+    def get_concurrency(self, source):
+        '''
+        Get AdaptiveConcurrency of a source, e.g. 'yahoo'
+        '''
+        with self._lock:
+            concurrency = self._concurrency_dict.get(source)
+            if concurrency is None:
+                concurrency = AdaptiveConcurrency(source, self.initial, self.min_limit, self.max_limit)
+                self._concurrency_dict[source] = concurrency
+            return concurrency
+
+    def set_limit(self, source, max_limit, min_limit = None):
+        '''
+        Set the highest and optionally the lowest number of calls in flight to a source
+        '''
+        self.get_concurrency(source).set_range(min_limit, max_limit)
+
+# Process-wide Concurrency Limiter shared by every fetcher
+CONCURRENCY_LIMITER = ConcurrencyLimiter()
+
+def call_with_retry(
+    func
+    , key = None
+    , policies = None
+):
+    '''
+    Call a function until it succeeds or its retry policy is exhausted.
+    It sleeps between attempts, so it suits a single download only; use run_batch for many.
+    Parameters
+    ----------
+    func : function
+           function without argument which downloads once and raises error if it fails
+    key : string
+          name of the download, usually a stock code
+    policies : dict
+               Dict of error class and RetryPolicy, get_default_policies() if None
+    Returns
+    -------
+    RetryResult
+    '''
+    policies = policies or get_default_policies()
+    result = RetryResult(key)
+    while True:
+        result.attempts += 1
+        try:
+            result.value = func()
+            result.status = STATUS_SUCCESS
+            result.error_class = None
+            result.error = None
+            return result
+        except Exception as error:
+            delay = handle_failure(result, error, policies)
+            if delay is None:
+                return result
+            time.sleep(delay)
+
+def iter_batch(
+    func
+    , key_list
+    , max_workers = 10
+    , policies = None
+    , callback = None
+    , checkpoint = None
+    , concurrency = None
+):
+    '''
+    Call a function for every key on a thread pool and yield each result as soon as it is final.
+    A failed call is re-queued after its backoff delay instead of sleeping in the worker,
+    so healthy keys keep the threads busy meanwhile.
+    Parameters
+    ----------
+    func : function
+           function of a key which downloads once and raises error if it fails
+    key_list : list
+               list of keys, usually stock codes
+    max_workers : int
+                  number of threads, which is also the highest number of calls in flight
+    policies : dict
+               Dict of error class and RetryPolicy, get_default_policies() if None
+    callback : function
+               function of (RetryResult, number of completed keys, number of keys)
+               called for every final result before it is yielded
+    checkpoint : checkpoint.Checkpoint
+                 the successful results saved in it are yielded first without calling the function,
+                 and every final result is saved in it as it arrives
+    concurrency : AdaptiveConcurrency
+                  adaptive limit of calls in flight shared with other batches of the source,
+                  max_workers calls are in flight if None
+    Returns
+    -------
+    generator of RetryResult in order of completion
+    '''
+    policies = policies or get_default_policies()
+    key_list = list(key_list)
+    completed_count = 0
+
+    if checkpoint is not None:
+        saved_dict = checkpoint.load()
+        logutil.getLogger(__name__).info('%d of %d keys are resumed from checkpoint.', len(saved_dict.keys() & set(map(str, key_list))), len(key_list))
+        pending_list = []
+        for key in key_list:
+            if str(key) in saved_dict:
+                result = saved_dict[str(key)]
+                result.key = key
+                completed_count += 1
+                if callback is not None:
+                    callback(result, completed_count, len(key_list))
+                yield result
+            else:
+                pending_list.append(key)
+    else:
+        pending_list = key_list
+    # Results ready to run, the retries which are due go first
+    ready_list = collections.deque(RetryResult(key) for key in pending_list)
+    # Heap of (time to run, sequence, RetryResult) waiting for retry
+    delayed_list = []
+    sequence = 0
+    future_to_result = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    def submit(result):
+        result.attempts += 1
+        if concurrency is None:
+            return executor.submit(func, result.key)
+        return executor.submit(concurrency.call, func, result.key)
+    def acquire():
+        return len(future_to_result) < max_workers and (concurrency is None or concurrency.try_acquire())
+
+    try:
+        while future_to_result or delayed_list or ready_list:
+            # Re-queue the retries which are due
+            now = time.time()
+            while delayed_list and delayed_list[0][0] <= now:
+                _, _, result = heapq.heappop(delayed_list)
+                ready_list.appendleft(result)
+            # Keep the limit of calls in flight, which may change as calls of any batch finish
+            while ready_list and acquire():
+                result = ready_list.popleft()
+                future_to_result[submit(result)] = result
+            wait_time = delayed_list[0][0] - now if delayed_list else None
+            if ready_list and len(future_to_result) < max_workers:
+                # Other batches hold the slots of the source, try again when one is freed
+                if not future_to_result:
+                    concurrency.wait(wait_time)
+                    continue
+                wait_time = CONCURRENCY_POLL_TIME if wait_time is None else min(wait_time, CONCURRENCY_POLL_TIME)
+            elif not future_to_result:
+                time.sleep(wait_time)
+                continue
+
+            done_set, _ = concurrent.futures.wait(
+                future_to_result
+                , timeout=wait_time
+                , return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done_set:
+                result = future_to_result.pop(future)
+                try:
+                    result.value = future.result()
+                    result.status = STATUS_SUCCESS
+                    result.error_class = None
+                    result.error = None
+                except Exception as error:
+                    delay = handle_failure(result, error, policies)
+                    if delay is not None:
+                        sequence += 1
+                        heapq.heappush(delayed_list, (time.time() + delay, sequence, result))
+                        continue
+                if checkpoint is not None:
+                    checkpoint.save(result)
+                completed_count += 1
+                if callback is not None:
+                    callback(result, completed_count, len(key_list))
+                yield result
+    finally:
+        # The consumer may stop early, do not download the rest
+        for future in future_to_result:
+            if future.cancel() and concurrency is not None:
+                concurrency.release()
+        executor.shutdown(wait=True)
+
+def run_batch(
+    func
+    , key_list
+    , max_workers = 10
+    , policies = None
+    , callback = None
+    , checkpoint = None
+    , concurrency = None
+):
+    '''
+    Call a function for every key on a thread pool, see iter_batch
+    Returns
+    -------
+    list of RetryResult in order of completion
+    '''
+    return list(iter_batch(func, key_list, max_workers=max_workers, policies=policies, callback=callback, checkpoint=checkpoint, concurrency=concurrency))
+
+def get_status_df(result_list):
+    '''
+    Get DataFrame of attempts and final status per key from a list of RetryResult
+    '''
+    return pd.DataFrame(
+        data=[result.to_dict() for result in result_list]
+        , columns=['key', 'attempts', 'status', 'error_class', 'error']
+        ).set_index('key', append=False)
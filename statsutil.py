@@ -0,0 +1,171 @@
+'''
+Utility module of in-process timings and counters of downloads
+Timings are histograms, counters are totals and gauges are current values,
+each broken down by labels such as source and proxy.
+A snapshot can be dumped as JSON or Prometheus text exposition format.
+'''
+# core modules
+import bisect
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+### Constant Values ###
+# Upper bounds in seconds of histogram buckets
+DEFAULT_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+PROMETHEUS_PREFIX = 'quanteki_'
+
+def get_label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def format_labels(label_key, extra = ()):
+    label_list = list(label_key) + list(extra)
+    if len(label_list) <= 0:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"')) for name, value in label_list) + '}'
+
+class Stats:
+    '''
+    Thread-safe registry of counters, gauges and timing histograms
+    '''
+    def __init__(self, buckets = DEFAULT_BUCKETS):
+        self.buckets = list(buckets)
+        self._lock = threading.Lock()
+        self._counter_dict = {}
+        self._gauge_dict = {}
+        self._timer_dict = {}
+
+    def increment(self, name, value = 1, **labels):
+        '''
+        Add a value to the counter of name and labels
+        '''
+        key = (name, get_label_key(labels))
+        with self._lock:
+            self._counter_dict[key] = self._counter_dict.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        '''
+        Set the current value of the gauge of name and labels
+        '''
+        key = (name, get_label_key(labels))
+        with self._lock:
+            self._gauge_dict[key] = value
+
+    def observe(self, name, seconds, **labels):
+        '''
+        Record a duration in the histogram of name and labels
+        '''
+        key = (name, get_label_key(labels))
+        with self._lock:
+            timer = self._timer_dict.get(key)
+            if timer is None:
+                timer = {'count': 0, 'sum': 0.0, 'min': seconds, 'max': seconds, 'buckets': [0] * (len(self.buckets) + 1)}
+                self._timer_dict[key] = timer
+            timer['count'] += 1
+            timer['sum'] += seconds
+            timer['min'] = min(timer['min'], seconds)
+            timer['max'] = max(timer['max'], seconds)
+            timer['buckets'][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        '''
+        Record the duration of a with block, even if it raises error
+        '''
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counter_dict = {}
+            self._gauge_dict = {}
+            self._timer_dict = {}
+
+    def snapshot(self):
+        '''
+        Get a copy of every counter and timing
+        Returns
+        -------
+        Dict of 'counters', 'gauges' and 'timers', each a list of dict with name, labels and values
+        '''
+        with self._lock:
+            return {
+                'counters': [
+                    {'name': name, 'labels': dict(label_key), 'value': value}
+                    for (name, label_key), value in sorted(self._counter_dict.items())
+                ]
+                , 'gauges': [
+                    {'name': name, 'labels': dict(label_key), 'value': value}
+                    for (name, label_key), value in sorted(self._gauge_dict.items())
+                ]
+                , 'timers': [
+                    dict(
+                        name=name
+                        , labels=dict(label_key)
+                        , count=timer['count']
+                        , sum=timer['sum']
+                        , min=timer['min']
+                        , max=timer['max']
+                        , buckets=dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], timer['buckets']))
+                    )
+                    for (name, label_key), timer in sorted(self._timer_dict.items())
+                ]
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=1, ensure_ascii=False)
+
+    def to_prometheus(self, prefix = PROMETHEUS_PREFIX):
+        '''
+        Get the snapshot in Prometheus text exposition format, counters as counter, gauges as gauge and timings as histogram
+        '''
+        snapshot = self.snapshot()
+        line_list = []
+        typed_set = set()
+        for metric_type, metric_list in [('counter', snapshot['counters']), ('gauge', snapshot['gauges'])]:
+            for metric in metric_list:
+                name = prefix + metric['name']
+                if name not in typed_set:
+                    line_list.append('# TYPE {} {}'.format(name, metric_type))
+                    typed_set.add(name)
+                line_list.append('{}{} {}'.format(name, format_labels(get_label_key(metric['labels'])), metric['value']))
+        for timer in snapshot['timers']:
+            name = prefix + timer['name']
+            label_key = get_label_key(timer['labels'])
+            if name not in typed_set:
+                line_list.append('# TYPE {} histogram'.format(name))
+                typed_set.add(name)
+            cumulative_count = 0
+            for bound, count in timer['buckets'].items():
+                cumulative_count += count
+                line_list.append('{}_bucket{} {}'.format(name, format_labels(label_key, [('le', bound)]), cumulative_count))
+            line_list.append('{}_sum{} {}'.format(name, format_labels(label_key), timer['sum']))
+            line_list.append('{}_count{} {}'.format(name, format_labels(label_key), timer['count']))
+        return '\n'.join(line_list) + '\n'
+
+    def dump(self, filepath):
+        '''
+        Write the snapshot into a file, Prometheus text if it ends with .prom, otherwise JSON
+        '''
+        with open(filepath, 'w', encoding='utf-8') as stats_file:
+            stats_file.write(self.to_prometheus() if filepath.endswith('.prom') else self.to_json())
+
+def timed(name, stats = None, **labels):
+    '''
+    Get decorator recording the duration of every call of a function
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            with (stats or STATS).timer(name, **labels):
+                return func(*args, **kwargs)
+        return timed_func
+    return decorator
+
+# Process-wide registry shared by every fetcher
+STATS = Stats()
@@ -1,44 +1,189 @@
 '''
 A standalone program to collect and generate the result of Stock Statistics
 '''
+# core modules
+import argparse
+import logutil
+import os
+
 # modules of Data Source
+import parseutil
+import webutil
 import hkex_list
 import bloomberg_data
 import yahoo_fin
+import aastocks_data
 
 # modules for Data Science
 import pandas as pd
 import excelutil
 
+# modules for concurrency
+import checkpoint
+import pipeline
+import retryutil
+import statsutil
+
 # modules for date time
 from datetime import datetime
 
-### Run as a main program ###
-if __name__ == '__main__':
+### Constant Values ###
+# One of excelutil.FORMAT_LIST, Parquet loads much faster than Excel downstream
+OUTPUT_FORMAT = excelutil.FORMAT_EXCEL
+# Number of download workers shared by the data sources running at the same time
+DEFAULT_MAX_WORKERS = 20
+STAGE_STOCK_LIST = 'hkex_list'
+STAGE_YAHOO = 'yahoo'
+STAGE_BLOOMBERG = 'bloomberg'
+STAGE_AASTOCKS = 'aastocks'
+
+def get_checkpoint(run_id, stage_name):
+    '''
+    Get the checkpoint of a data source in a run, None if run_id is None
+    '''
+    return None if run_id is None else checkpoint.Checkpoint(run_id, stage_name)
+
+def set_stock_id_index(df, separator):
+    '''
+    Re-index a DataFrame keyed by Stock Code (string) with Stock ID (int)
+    '''
+    df['stock_id'] = df.index.str.split(separator).str.get(0).astype(int).values
+    return df.set_index('stock_id', append=False)
+
+def get_stock_df(inputs, max_workers, proxy_flag, parse_workers, run_id, adaptive_flag):
     # Get Stock List, key is Stock ID (int)
-    stock_df = hkex_list.download_stocks_df(proxy_flag=True)
-    # Get Stock Statistics from Bloomberg, key is Stock Code (string)
-    # stock_bb = bloomberg_data.download_bloomberg_df(
-    #    stock_code_list=[bloomberg_data.get_hk_bloomberg_code(stock_id) for stock_id in stock_df.index]
-    #    , max_workers=20
-    #    , proxy_flag=True
-    #    )
-    # stock_bb['stock_id'] = stock_bb.index.str.split(':').str.get(0).astype(int).values
-    # stock_bb = stock_bb.set_index('stock_id', append=False)
+    return hkex_list.download_stocks_df(proxy_flag=proxy_flag)
+
+def get_yahoo_df(inputs, max_workers, proxy_flag, parse_workers, run_id, adaptive_flag):
     # Get Stock Statistics from Yahoo! Finance, key is Stock Code (string)
     stock_yf = yahoo_fin.get_stock_quote_df(
-        stock_code_list=[yahoo_fin.get_hk_yahoo_code(stock_id) for stock_id in stock_df.index]
-        , max_workers=20
-        , proxy_flag=True
+        stock_code_list=[yahoo_fin.get_hk_yahoo_code(stock_id) for stock_id in inputs[STAGE_STOCK_LIST].index]
+        , max_workers=max_workers
+        , proxy_flag=proxy_flag
+        , normalize=True
+        , parse_workers=parse_workers
+        , adaptive=adaptive_flag
+        , checkpoint=get_checkpoint(run_id, STAGE_YAHOO)
+        )
+    return set_stock_id_index(stock_yf, '.')
+
+def get_bloomberg_df(inputs, max_workers, proxy_flag, parse_workers, run_id, adaptive_flag):
+    # Get Stock Statistics from Bloomberg, key is Stock Code (string)
+    stock_bb = bloomberg_data.download_bloomberg_df(
+        stock_code_list=[bloomberg_data.get_hk_bloomberg_code(stock_id) for stock_id in inputs[STAGE_STOCK_LIST].index]
+        , max_workers=max_workers
+        , proxy_flag=proxy_flag
+        , normalize=True
+        , parse_workers=parse_workers
+        , adaptive=adaptive_flag
+        , checkpoint=get_checkpoint(run_id, STAGE_BLOOMBERG)
+        )
+    return set_stock_id_index(stock_bb, ':')
+
+def get_aastocks_df(inputs, max_workers, proxy_flag, parse_workers, run_id, adaptive_flag):
+    # Get the latest dividend from AASTOCKS, key is Stock Code (string)
+    stock_aa = aastocks_data.download_dividend_hist_df(
+        stock_code_list=[aastocks_data.get_hk_aastocks_code(stock_id) for stock_id in inputs[STAGE_STOCK_LIST].index]
+        , max_workers=max_workers
+        , proxy_flag=proxy_flag
+        , adaptive=adaptive_flag
+        , checkpoint=get_checkpoint(run_id, STAGE_AASTOCKS)
+        )
+    if len(stock_aa) <= 0:
+        return pd.DataFrame(index=pd.Index([], name='stock_id'))
+    stock_aa = stock_aa.sort_values('announce_date').drop_duplicates('stock_code', keep='last').set_index('stock_code')
+    return set_stock_id_index(stock_aa, ' ')
+
+def get_stage_list(yahoo_flag=True, bloomberg_flag=False, aastocks_flag=False, proxy_flag=True, parse_workers=parseutil.DEFAULT_PARSE_WORKERS, run_id=None, adaptive_flag=False):
+    '''
+    Get stages of the stock list and the enabled data sources, which run at the same time.
+    The data sources share the parser processes if parse_workers is positive.
+    Stocks of the data sources are saved in the checkpoint of run_id, and those completed before are not downloaded again.
+    Calls in flight to each data source adapt to its latency and errors up to the workers of the stage if adaptive_flag is True.
+    '''
+    stage_list = [pipeline.Stage(STAGE_STOCK_LIST, lambda inputs, max_workers: get_stock_df(inputs, max_workers, proxy_flag, parse_workers, run_id, adaptive_flag))]
+    for source_flag, stage_name, source_func in [
+        (yahoo_flag, STAGE_YAHOO, get_yahoo_df)
+        , (bloomberg_flag, STAGE_BLOOMBERG, get_bloomberg_df)
+        , (aastocks_flag, STAGE_AASTOCKS, get_aastocks_df)
+    ]:
+        if source_flag:
+            stage_list.append(pipeline.Stage(
+                stage_name
+                , lambda inputs, max_workers, source_func=source_func: source_func(inputs, max_workers, proxy_flag, parse_workers, run_id, adaptive_flag)
+                , depends=[STAGE_STOCK_LIST]
+            ))
+    return stage_list
+
+def collect_stock_stat(stage_list, max_workers=DEFAULT_MAX_WORKERS):
+    '''
+    Run the stages and join the result of every data source on Stock ID as soon as it completes
+    '''
+    logger = logutil.getLogger(__name__)
+
+    stock_stat = None
+    for result in pipeline.iter_pipeline(stage_list, max_workers=max_workers):
+        if result.value is None:
+            logger.error('Data source %s is not available.', result.key)
+            continue
+        stock_stat = result.value if stock_stat is None else stock_stat.join(result.value, how='left')
+    return stock_stat
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Collect and generate the result of Stock Statistics')
+    parser.add_argument('--no-yahoo', dest='yahoo_flag', action='store_false', help='skip quotes of Yahoo! Finance')
+    parser.add_argument('--bloomberg', dest='bloomberg_flag', action='store_true', help='add quotes of Bloomberg')
+    parser.add_argument('--aastocks', dest='aastocks_flag', action='store_true', help='add the latest dividend of AASTOCKS')
+    parser.add_argument('--no-proxy', dest='proxy_flag', action='store_false', help='download without proxy servers')
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS, help='download workers shared by the data sources, which cap the adaptive calls in flight')
+    parser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 1, help='parser processes shared by the data sources, 0 parses in the download threads')
+    parser.add_argument('--output-format', choices=excelutil.FORMAT_LIST, default=OUTPUT_FORMAT, help='format of the result file')
+    parser.add_argument('--no-adaptive', dest='adaptive_flag', action='store_false', help='keep max workers in flight instead of adapting to latency and errors of each data source')
+    parser.add_argument('--concurrency-limit', action='append', default=[], metavar='SOURCE=N', help='highest calls in flight to a data source, e.g. bloomberg=4')
+    parser.add_argument('--host-rate', action='append', default=[], metavar='HOST=RATE', help='requests per second allowed to a host, e.g. www.bloomberg.com=5, no limit until it throttles by default')
+    parser.add_argument('--resume', action='store_true', help='continue the latest run, downloading only the stocks which are missing or failed')
+    parser.add_argument('--run-id', default=None, help='id of the run to continue or to start, a new one of the current time by default')
+    parser.add_argument('--stats-file', default=None, help='file of timings and counters, Prometheus text if it ends with .prom, otherwise JSON')
+    return parser
+
+### Run as a main program ###
+if __name__ == '__main__':
+    args = get_parser().parse_args()
+    run_id = args.run_id
+    if run_id is None and args.resume:
+        run_id = checkpoint.get_latest_run_id()
+    if run_id is None:
+        run_id = checkpoint.create_run_id()
+    for source_limit in args.concurrency_limit:
+        source, limit = source_limit.split('=', 1)
+        retryutil.CONCURRENCY_LIMITER.set_limit(source, int(limit))
+    for host_rate in args.host_rate:
+        host, rate = host_rate.split('=', 1)
+        webutil.RATE_LIMITER.set_limit(host, float(rate))
+    checkpoint.start_run(run_id)
+    logutil.getLogger(__name__).info('Run %s starts, continue it with --run-id %s if it is interrupted.', run_id, run_id)
+    # The stock list comes first, then the data sources are downloaded at the same time
+    stock_stat = collect_stock_stat(
+        get_stage_list(
+            yahoo_flag=args.yahoo_flag
+            , bloomberg_flag=args.bloomberg_flag
+            , aastocks_flag=args.aastocks_flag
+            , proxy_flag=args.proxy_flag
+            , parse_workers=args.parse_workers
+            , run_id=run_id
+            , adaptive_flag=args.adaptive_flag
+            )
+        , max_workers=args.max_workers
         )
-    stock_yf['stock_id'] = stock_yf.index.str.split('.').str.get(0).astype(int).values
-    stock_yf = stock_yf.set_index('stock_id', append=False)
-    # Concatenate three DataFrame objects
-    # stock_stat = pd.concat([stock_df, stock_bb, stock_yf], axis=1)
-    stock_stat = pd.concat([stock_df, stock_yf], axis=1)
-    # Save the resulted DataFrame into a local Excel file
-    excelutil.save_excel_file(
+    parseutil.close_parse_pool()
+    # Save the resulted DataFrame into a local file of the output format
+    excelutil.save_df(
         stock_stat
-        , 'stock_stat.' + datetime.now().strftime(yahoo_fin.YAHOO_DATE_FORMAT) + '.xlsx'
-        , 'stock_stat'
+        , 'stock_stat.' + datetime.now().strftime(yahoo_fin.YAHOO_DATE_FORMAT) + '.' + args.output_format
+        , sheetname='stock_stat'
         )
+    # The result is saved, so the run is not to be resumed
+    checkpoint.finish_run(run_id)
+    # Dump timings and counters to find out where the time goes
+    stats_file = args.stats_file or 'stock_stat.' + datetime.now().strftime(yahoo_fin.YAHOO_DATE_FORMAT) + '.stats.json'
+    statsutil.STATS.dump(stats_file)
@@ -0,0 +1,155 @@
+'''
+Module of local stock list store in SQLite keyed by Stock ID
+'''
+# core modules
+import logutil
+import os
+import sqlite3
+from contextlib import contextmanager
+
+# modules for Data Science
+import pandas as pd
+
+# modules for date time
+from datetime import datetime
+
+### Constant Values ###
+DEFAULT_DB_FILENAME = 'stock_list.sqlite'
+# Kinds of change recorded by refresh
+CHANGE_LISTED = 'listed'
+CHANGE_DELISTED = 'delisted'
+CHANGE_UPDATED = 'updated'
+STOCK_COLUMNS = ['stock_id', 'chi_name', 'url']
+
+class StockListStore:
+    '''
+    Local store of the stock list keyed by Stock ID, with a log of listings and delistings
+    Parameters
+    ----------
+    db_path : string
+              path of the SQLite database
+    create_flag : boolean
+                  Whether a missing database is created, otherwise FileNotFoundError is raised
+    '''
+    def __init__(self, db_path = DEFAULT_DB_FILENAME, create_flag = True):
+        self.db_path = db_path
+        if not create_flag and not os.path.exists(db_path):
+            raise FileNotFoundError('No stock list store at {}'.format(db_path))
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS stock_list ('
+                'stock_id INTEGER PRIMARY KEY, chi_name TEXT, url TEXT, listed_at TEXT, updated_at TEXT)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS stock_change ('
+                'stock_id INTEGER, change TEXT, changed_at TEXT, chi_name TEXT, url TEXT)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS stock_change_id ON stock_change (stock_id)')
+
+    @contextmanager
+    def _connect(self):
+        # Commit on success, roll back on error, and always close
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_stock(self, stock_id):
+        '''
+        Get a Dict of stock information (Stock ID, Stock Name, Company URL) by Stock ID, None if not listed
+        '''
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT stock_id, chi_name, url FROM stock_list WHERE stock_id = ?'
+                , (int(stock_id), )
+            ).fetchone()
+        return None if row is None else dict(zip(STOCK_COLUMNS, row))
+
+    def read_df(self):
+        '''
+        Read the stock list as DataFrame indexed by Stock ID
+        '''
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                'SELECT stock_id, chi_name, url FROM stock_list ORDER BY stock_id'
+                , conn
+                , index_col='stock_id'
+            )
+
+    def read_changes(self):
+        '''
+        Read the log of listings, delistings and updates as DataFrame
+        '''
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                'SELECT stock_id, change, changed_at, chi_name, url FROM stock_change ORDER BY changed_at, stock_id'
+                , conn
+                , parse_dates=['changed_at']
+            )
+
+    def refresh(self, stock_list):
+        '''
+        Apply a newly downloaded stock list by its difference from the stored one
+        Parameters
+        ----------
+        stock_list : list
+                     list of Dict of stock information (Stock ID, Stock Name, Company URL)
+        Returns
+        -------
+        Dict of change kind and number of stocks
+        '''
+        logger = logutil.getLogger(__name__)
+        if len(stock_list) <= 0:
+            # A failed download must not delist the whole market
+            logger.error('Stock list is empty, the store is not refreshed.')
+            return {CHANGE_LISTED: 0, CHANGE_DELISTED: 0, CHANGE_UPDATED: 0}
+
+        changed_at = datetime.now().isoformat(timespec='seconds')
+        new_dict = {int(stock['stock_id']): stock for stock in stock_list}
+        with self._connect() as conn:
+            old_dict = {
+                row[0]: dict(zip(STOCK_COLUMNS, row))
+                for row in conn.execute('SELECT stock_id, chi_name, url FROM stock_list')
+            }
+            listed_list = [new_dict[stock_id] for stock_id in new_dict.keys() - old_dict.keys()]
+            delisted_list = [old_dict[stock_id] for stock_id in old_dict.keys() - new_dict.keys()]
+            updated_list = [
+                new_dict[stock_id] for stock_id in new_dict.keys() & old_dict.keys()
+                if (new_dict[stock_id]['chi_name'], new_dict[stock_id]['url']) != (old_dict[stock_id]['chi_name'], old_dict[stock_id]['url'])
+            ]
+
+            conn.executemany(
+                'INSERT INTO stock_list (stock_id, chi_name, url, listed_at, updated_at) VALUES (?, ?, ?, ?, ?)'
+                , [(int(stock['stock_id']), stock['chi_name'], stock['url'], changed_at, changed_at) for stock in listed_list]
+            )
+            conn.executemany(
+                'UPDATE stock_list SET chi_name = ?, url = ?, updated_at = ? WHERE stock_id = ?'
+                , [(stock['chi_name'], stock['url'], changed_at, int(stock['stock_id'])) for stock in updated_list]
+            )
+            conn.executemany(
+                'DELETE FROM stock_list WHERE stock_id = ?'
+                , [(int(stock['stock_id']), ) for stock in delisted_list]
+            )
+            conn.executemany(
+                'INSERT INTO stock_change (stock_id, change, changed_at, chi_name, url) VALUES (?, ?, ?, ?, ?)'
+                , [
+                    (int(stock['stock_id']), change, changed_at, stock['chi_name'], stock['url'])
+                    for change, change_list in [
+                        (CHANGE_LISTED, listed_list)
+                        , (CHANGE_DELISTED, delisted_list)
+                        , (CHANGE_UPDATED, updated_list)
+                    ]
+                    for stock in change_list
+                ]
+            )
+        logger.info(
+            'Stock list refreshed with %d listed, %d delisted and %d updated.'
+            , len(listed_list), len(delisted_list), len(updated_list)
+        )
+        return {
+            CHANGE_LISTED: len(listed_list)
+            , CHANGE_DELISTED: len(delisted_list)
+            , CHANGE_UPDATED: len(updated_list)
+        }
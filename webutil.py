@@ -1,11 +1,113 @@
 '''
 Utility module of Web operation
 '''
+# core modules
+import logutil
+import hashlib
+import http.cookiejar
+import json
+import os
+import pickle
+
 from urllib.request import Request, urlopen
-from bs4 import BeautifulSoup
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+import parseutil
+import statsutil
 from fake_useragent import UserAgent
 import random
 import requests
+from requests.adapters import HTTPAdapter
+
+# modules for concurrency
+import collections
+import concurrent.futures
+import threading
+import time
+
+### Constant Values ###
+# Number of connections kept alive per host when no caller asks for more
+DEFAULT_POOL_SIZE = 10
+# Number of distinct hosts whose connection pools are cached
+DEFAULT_POOL_HOSTS = 20
+# Seconds before the proxy list is refreshed in background
+PROXY_TTL = 1800
+# Consecutive failures before a proxy is quarantined
+PROXY_MAX_FAILURES = 2
+# Seconds during which a quarantined proxy is not chosen
+PROXY_QUARANTINE_TIME = 300
+# Latency assumed for a proxy which has not been measured yet
+PROXY_DEFAULT_LATENCY = 1.0
+# Weight of the latest measurement in the moving average of latency
+PROXY_LATENCY_ALPHA = 0.3
+# Requests per second and burst size allowed per host unless set otherwise, no limit if the rate is None
+DEFAULT_HOST_RATE = None
+DEFAULT_HOST_BURST = 20
+# Rate at which the limit of a host without limit is lifted again, its first 429 slows it down to
+# THROTTLE_START_RATE * THROTTLE_BACKOFF, and seconds without 429 required before the limit is lifted
+THROTTLE_START_RATE = 10.0
+THROTTLE_QUIET_TIME = 60.0
+# Factor applied to the rate of a host on 429, and the lowest rate it goes down to
+THROTTLE_BACKOFF = 0.5
+THROTTLE_MIN_RATE = 0.2
+# Requests per second the rate of a host recovers on every successful response
+THROTTLE_RECOVERY = 0.05
+# Directory and size cap in bytes of the on-disk response cache,
+# which holds a universe of about 2,500 AASTOCKS dividend pages with their parsed results
+DEFAULT_CACHE_DIR = 'http_cache'
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+# Number of entries of the in-memory cache of parsed results
+DEFAULT_MEMORY_CACHE_SIZE = 10000
+
+# Process-wide HTTP session shared by every fetcher
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+def get_session(pool_size=None):
+    '''
+    Get the process-wide HTTP session which keeps keep-alive connection pools per host
+    Parameters
+    ----------
+    pool_size : int
+                number of connections kept per host, usually max_workers of the caller.
+                The pools only grow, so a smaller value never shrinks a larger pool.
+    Returns
+    -------
+    requests.Session shared by all fetchers
+    '''
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            # Connections are shared but cookies are not, every request starts without cookies as before
+            _session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        target_size = max(pool_size or DEFAULT_POOL_SIZE, 1)
+        if target_size > _session_pool_size:
+            # Mount a larger adapter; requests in flight keep using the old one,
+            # whose connections are closed as they are returned
+            old_adapter = _session.adapters.get('https://') if _session_pool_size > 0 else None
+            adapter = HTTPAdapter(
+                pool_connections=DEFAULT_POOL_HOSTS
+                , pool_maxsize=target_size
+            )
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session_pool_size = target_size
+            if old_adapter is not None:
+                old_adapter.close()
+        return _session
+
+def close_session():
+    '''
+    Close the process-wide HTTP session and release all pooled connections
+    '''
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pool_size = 0
 
 def get_proxy_list():
     '''
@@ -19,7 +121,7 @@ def get_proxy_list():
     proxies_req.add_header('User-Agent', ua.random)
     proxies_doc = urlopen(proxies_req).read().decode('utf8')
 
-    soup = BeautifulSoup(proxies_doc, 'html.parser')
+    soup = parseutil.make_soup(proxies_doc, parse_only=parseutil.make_strainer(id='proxylisttable'))
     proxies_table = soup.find(id='proxylisttable')
 
     # Save proxies in the array
@@ -32,19 +134,313 @@ def get_proxy_list():
     
     return proxies
 
+def get_proxy_key(proxy_server):
+    '''
+    Get the key of a Proxy Server in format of ip:port
+    '''
+    return proxy_server['ip'] + ':' + proxy_server['port']
+
+class ProxyPool:
+    '''
+    Pool of Proxy Servers which is loaded on first use, refreshed in background
+    after its TTL expires, and chooses proxies weighted by their health.
+    Health of a proxy is its smoothed success rate divided by its average latency.
+    A proxy failing PROXY_MAX_FAILURES times in a row is quarantined for a while.
+    '''
+    def __init__(
+        self
+        , loader = get_proxy_list
+        , ttl = PROXY_TTL
+        , max_failures = PROXY_MAX_FAILURES
+        , quarantine_time = PROXY_QUARANTINE_TIME
+    ):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_failures = max_failures
+        self.quarantine_time = quarantine_time
+        self._lock = threading.Lock()
+        self._proxy_list = []
+        self._stats = {}
+        self._loaded_at = None
+        self._refreshing = False
+        # Held during the first load only
+        self._load_lock = threading.Lock()
+
+    def _new_stat(self):
+        return {
+            'success': 0
+            , 'failure': 0
+            , 'consecutive_failure': 0
+            , 'latency': PROXY_DEFAULT_LATENCY
+            , 'quarantine_until': 0.0
+        }
+
+    def _update_list(self, proxy_list):
+        # Keep the health of proxies which are still listed
+        with self._lock:
+            self._proxy_list = list(proxy_list)
+            self._stats = {
+                get_proxy_key(proxy): self._stats.get(get_proxy_key(proxy)) or self._new_stat()
+                for proxy in self._proxy_list
+            }
+            self._loaded_at = time.time()
+
+    def _refresh(self):
+        logger = logutil.getLogger(__name__)
+        try:
+            self._update_list(self.loader())
+            logger.info('Proxy list refreshed with %d proxies.', len(self._proxy_list))
+        except Exception as error:
+            logger.error('Failed to refresh proxy list because %s', error)
+            # Keep the current list and try again after another TTL
+            with self._lock:
+                self._loaded_at = time.time()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure_loaded(self):
+        with self._lock:
+            loaded_at = self._loaded_at
+            if loaded_at is not None and not self._refreshing and time.time() - loaded_at > self.ttl:
+                self._refreshing = True
+                threading.Thread(target=self._refresh, daemon=True).start()
+        if loaded_at is None:
+            # The first load is synchronous and its error goes to the caller.
+            # One caller loads while the others wait for it, then find the list loaded.
+            with self._load_lock:
+                with self._lock:
+                    loaded_at = self._loaded_at
+                if loaded_at is None:
+                    self._update_list(self.loader())
+
+    def health(self, proxy_server):
+        '''
+        Get health score of a Proxy Server, higher is better
+        '''
+        with self._lock:
+            stat = self._stats.get(get_proxy_key(proxy_server)) or self._new_stat()
+        return self._score(stat)
+
+    def _score(self, stat):
+        success_rate = (stat['success'] + 1.0) / (stat['success'] + stat['failure'] + 2.0)
+        return success_rate / max(stat['latency'], 0.01)
+
+    def get_proxy(self, port_list = None):
+        '''
+        Get a Proxy Server randomly, weighted by health, from the pool
+        Parameters
+        ----------
+        port_list : list
+                    Only proxies of the given ports are chosen if the list is not empty
+        Returns
+        -------
+        Dict of Proxy Server (ip, port)
+        '''
+        self._ensure_loaded()
+        now = time.time()
+        with self._lock:
+            candidate_list = [
+                proxy for proxy in self._proxy_list
+                if not port_list or proxy['port'] in port_list
+            ]
+            if len(candidate_list) <= 0:
+                raise LookupError('No proxy server is available')
+            healthy_list = [
+                proxy for proxy in candidate_list
+                if self._stats[get_proxy_key(proxy)]['quarantine_until'] <= now
+            ]
+            if len(healthy_list) <= 0:
+                # All are quarantined, use the one to be released earliest
+                return min(candidate_list, key=lambda proxy: self._stats[get_proxy_key(proxy)]['quarantine_until'])
+            weight_list = [self._score(self._stats[get_proxy_key(proxy)]) for proxy in healthy_list]
+        return random.choices(healthy_list, weights=weight_list)[0]
+
+    def report(self, proxy_server, success, latency = None):
+        '''
+        Report the outcome of a request made via a Proxy Server
+        Parameters
+        ----------
+        proxy_server : dict
+                       Proxy Server (ip, port) used by the request
+        success : boolean
+                  Whether the proxy delivered a response
+        latency : float
+                  Seconds taken by the request
+        '''
+        with self._lock:
+            stat = self._stats.get(get_proxy_key(proxy_server))
+            if stat is None:
+                # Not a proxy of this pool
+                return
+            if latency is not None:
+                stat['latency'] = (1 - PROXY_LATENCY_ALPHA) * stat['latency'] + PROXY_LATENCY_ALPHA * latency
+            if success:
+                stat['success'] += 1
+                stat['consecutive_failure'] = 0
+            else:
+                stat['failure'] += 1
+                stat['consecutive_failure'] += 1
+                if stat['consecutive_failure'] >= self.max_failures:
+                    stat['quarantine_until'] = time.time() + self.quarantine_time
+
+# Process-wide Proxy Pool shared by every fetcher
+PROXY_POOL = ProxyPool()
+
+def get_retry_after(headers):
+    '''
+    Get seconds of Retry-After header, which is either seconds or HTTP date, None if absent
+    '''
+    retry_after = headers.get('Retry-After') if headers is not None else None
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    '''
+    Token bucket of a host allowing rate requests per second with bursts up to burst requests.
+    The rate drops on 429 and recovers gradually towards the configured rate on success.
+    A host without rate is not limited until it throttles, and is not limited again
+    once its rate recovers to THROTTLE_START_RATE with no 429 for THROTTLE_QUIET_TIME seconds.
+    '''
+    def __init__(self, rate = DEFAULT_HOST_RATE, burst = DEFAULT_HOST_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._throttled_at = None
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        '''
+        Take a token
+        Returns
+        -------
+        Seconds to wait before sending the request
+        '''
+        with self._lock:
+            now = time.monotonic()
+            if self.rate is None:
+                # Only the pause after a 429 holds requests to a host without limit
+                return max(self._updated - now, 0.0)
+            if now > self._updated:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+            self._tokens -= 1
+            # Refill restarts at _updated, which is in the future while the host is paused
+            return max(self._updated - now, 0.0) + max(-self._tokens, 0.0) / self.rate
+
+    def throttle(self, retry_after = None):
+        '''
+        Slow down after a 429 response, pausing for retry_after seconds if given
+        '''
+        with self._lock:
+            now = time.monotonic()
+            rate = THROTTLE_START_RATE if self.rate is None else self.rate
+            self.rate = max(THROTTLE_MIN_RATE, rate * THROTTLE_BACKOFF)
+            self._throttled_at = now
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = max(self._updated, now + pause)
+
+    def recover(self):
+        '''
+        Speed up towards the configured rate after a successful response
+        '''
+        with self._lock:
+            if self.rate is None:
+                return
+            if self.max_rate is None:
+                self.rate = min(THROTTLE_START_RATE, self.rate + THROTTLE_RECOVERY)
+                if self.rate >= THROTTLE_START_RATE and time.monotonic() - self._throttled_at >= THROTTLE_QUIET_TIME:
+                    self.rate = None
+                    self._throttled_at = None
+            elif self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + THROTTLE_RECOVERY)
+
+class RateLimiter:
+    '''
+    Per-host token bucket rate limiter shared by every fetcher
+    '''
+    def __init__(self, rate = DEFAULT_HOST_RATE, burst = DEFAULT_HOST_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._bucket_dict = {}
+        self._lock = threading.Lock()
+
+    def set_limit(self, host, rate, burst = None):
+        '''
+        Set requests per second and burst size of a host, e.g. 'www.bloomberg.com'
+        '''
+        with self._lock:
+            self._bucket_dict[host] = TokenBucket(rate, burst or max(int(rate), 1))
+
+    def get_bucket(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            bucket = self._bucket_dict.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._bucket_dict[host] = bucket
+            return bucket
+
+    def reserve(self, url):
+        '''
+        Take a token of the host of url
+        Returns
+        -------
+        Seconds to wait before sending the request
+        '''
+        return self.get_bucket(url).reserve()
+
+    def acquire(self, url):
+        '''
+        Block until a request to the host of url is allowed
+        '''
+        wait_time = self.reserve(url)
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def report(self, url, status_code, headers = None):
+        '''
+        Adjust the rate of the host of url by the status code of its response
+        '''
+        bucket = self.get_bucket(url)
+        if status_code == 429 or (status_code == 503 and headers is not None and 'Retry-After' in headers):
+            bucket.throttle(get_retry_after(headers))
+        elif status_code < 400:
+            bucket.recover()
+
+# Process-wide Rate Limiter shared by every fetcher
+RATE_LIMITER = RateLimiter()
+
 def get_random_proxy(
-    proxy_list = get_proxy_list()
+    proxy_list = None
     , port_list = []
 ):
     '''
-    Get a Proxy Server randomly from a proxy list
+    Get a Proxy Server randomly from a proxy list, or from PROXY_POOL if no list is given
     '''
+    if proxy_list is None:
+        return PROXY_POOL.get_proxy(port_list)
     if port_list and len(port_list) > 0:
         tmp_list = [proxy for proxy in proxy_list if proxy['port'] in port_list]
         return tmp_list[random.randint(0, len(tmp_list) - 1)]
     else:
         return proxy_list[random.randint(0, len(proxy_list) - 1)]
 
+# Default headers of HTTP GET requests
+DEFAULT_USER_AGENT = UserAgent().random
+DEFAULT_REFERER = 'http://www.google.com'
+
 # Create Request of Web Crawler
 def create_web_request(
     url
@@ -73,22 +469,301 @@ def create_default_request(url, proxy_server = None):
 
 def create_get_request(
     url
-    , user_agent = UserAgent().random
-    , referer = 'http://www.google.com'
+    , user_agent = DEFAULT_USER_AGENT
+    , referer = DEFAULT_REFERER
     , cookies = None
     , proxy_server = None    
     , timeout = None
+    , extra_headers = None
 ):
-    sess = requests.Session()
+    sess = get_session()
+    # Proxies are given per request so that threads sharing the session do not interfere.
+    # They are SSL proxies, so https URLs are tunnelled through them as well.
+    proxies = None
     if proxy_server is not None:
-        sess.proxies = {"http": "http://" + proxy_server['ip'] + ':' + proxy_server['port']}
+        proxy_url = "http://" + proxy_server['ip'] + ':' + proxy_server['port']
+        proxies = {"http": proxy_url, "https": proxy_url}
 
     headers = {
         'User-Agent': user_agent
         , 'referer': referer
     }
+    if extra_headers is not None:
+        headers.update(extra_headers)
 
-    if cookies is not None:
-        return sess.get(url, cookies=cookies, headers=headers, timeout=timeout)
-    else:
-        return sess.get(url, headers=headers, timeout=timeout)
\ No newline at end of file
+    # Phases are recorded per host and proxy; DNS, connect and time to first byte are one phase
+    # as the pooled connections of requests do not expose them apart
+    labels = {
+        'source': urlsplit(url).netloc
+        , 'proxy': 'direct' if proxy_server is None else get_proxy_key(proxy_server)
+    }
+    with statsutil.STATS.timer('rate_wait_seconds', **labels):
+        RATE_LIMITER.acquire(url)
+    start_time = time.perf_counter()
+    try:
+        # The body is read apart from the headers to time its transfer
+        if cookies is not None:
+            response = sess.get(url, cookies=cookies, headers=headers, proxies=proxies, timeout=timeout, stream=True)
+        else:
+            response = sess.get(url, headers=headers, proxies=proxies, timeout=timeout, stream=True)
+        headers_time = time.perf_counter()
+        content = response.content
+    except requests.exceptions.RequestException as error:
+        statsutil.STATS.increment('request_errors_total', error=type(error).__name__, **labels)
+        statsutil.STATS.observe('request_seconds', time.perf_counter() - start_time, **labels)
+        if proxy_server is not None:
+            PROXY_POOL.report(proxy_server, False, time.perf_counter() - start_time)
+        raise
+    end_time = time.perf_counter()
+    statsutil.STATS.observe('headers_seconds', headers_time - start_time, **labels)
+    statsutil.STATS.observe('body_seconds', end_time - headers_time, **labels)
+    statsutil.STATS.observe('request_seconds', end_time - start_time, **labels)
+    statsutil.STATS.increment('requests_total', status=response.status_code, **labels)
+    statsutil.STATS.increment('response_bytes_total', len(content), **labels)
+    if proxy_server is not None:
+        PROXY_POOL.report(proxy_server, response.status_code < 500, end_time - start_time)
+    RATE_LIMITER.report(url, response.status_code, response.headers)
+    return response
+
+def get_func_name(func):
+    '''
+    Get qualified name of a function which identifies its parsed results in ResponseCache
+    '''
+    return getattr(func, '__module__', '') + '.' + getattr(func, '__qualname__', getattr(func, '__name__', ''))
+
+class ResponseCache:
+    '''
+    On-disk cache of HTTP responses for pages which change rarely.
+    A response younger than its TTL is served without any request, an older one is
+    revalidated by ETag/Last-Modified so that 304 skips the transfer.
+    Parsed results are kept by content hash so that unchanged content is not parsed again.
+    The least recently used entries are evicted once the cache exceeds max_size bytes.
+    '''
+    def __init__(self, cache_dir = DEFAULT_CACHE_DIR, max_size = DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._total_size = None
+        # Dict of URL hash and Dict of its file paths and their sizes, least recently used first
+        self._entry_dict = collections.OrderedDict()
+
+    def _get_path(self, url, suffix):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + suffix)
+
+    def _ensure_dir(self):
+        # Scan the directory once to index its entries by last access, the modified time of the body
+        if self._total_size is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            access_dict = {}
+            for entry in os.scandir(self.cache_dir):
+                if not entry.is_file() or entry.name.endswith('.tmp'):
+                    continue
+                url_hash = entry.name.split('.', 1)[0]
+                stat = entry.stat()
+                self._entry_dict.setdefault(url_hash, {})[entry.path] = stat.st_size
+                if entry.name.endswith('.body'):
+                    access_dict[url_hash] = stat.st_mtime
+            self._entry_dict = collections.OrderedDict(
+                sorted(self._entry_dict.items(), key=lambda item: access_dict.get(item[0], 0.0))
+            )
+            self._total_size = sum(sum(file_dict.values()) for file_dict in self._entry_dict.values())
+
+    def _touch(self, file_path):
+        url_hash = os.path.basename(file_path).split('.', 1)[0]
+        self._entry_dict.setdefault(url_hash, {})
+        self._entry_dict.move_to_end(url_hash)
+        return self._entry_dict[url_hash]
+
+    def _read_meta(self, url):
+        meta_path = self._get_path(url, '.meta.json')
+        if not os.path.exists(meta_path) or not os.path.exists(self._get_path(url, '.body')):
+            return None
+        with open(meta_path, 'r') as meta_file:
+            return json.load(meta_file)
+
+    def _write_file(self, file_path, content):
+        old_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        with open(file_path + '.tmp', 'wb') as cache_file:
+            cache_file.write(content)
+        os.replace(file_path + '.tmp', file_path)
+        self._total_size += len(content) - old_size
+        self._touch(file_path)[file_path] = len(content)
+
+    def _write_meta(self, url, meta):
+        self._write_file(self._get_path(url, '.meta.json'), json.dumps(meta).encode('utf-8'))
+
+    def _read_body(self, url):
+        body_path = self._get_path(url, '.body')
+        # Modified time of the body is the last access time for LRU eviction after a restart
+        os.utime(body_path)
+        self._touch(body_path)
+        with open(body_path, 'rb') as body_file:
+            return body_file.read()
+
+    def _evict(self):
+        while self._total_size > self.max_size and self._entry_dict:
+            _, file_dict = self._entry_dict.popitem(last=False)
+            for file_path, size in file_dict.items():
+                self._total_size -= size
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+
+    def get(self, url, ttl, proxy_server = None, timeout = None):
+        '''
+        Get content of a URL from cache, downloading or revalidating it if needed
+        Parameters
+        ----------
+        url : string
+              URL to download
+        ttl : float
+              Seconds during which cached content is used without any request
+        Returns
+        -------
+        Tuple of content in bytes and its SHA-256 hash
+        '''
+        with self._lock:
+            self._ensure_dir()
+            meta = self._read_meta(url)
+            if meta is not None and time.time() - meta['fetched_at'] <= ttl:
+                return self._read_body(url), meta['content_hash']
+
+        extra_headers = {}
+        if meta is not None and meta.get('etag'):
+            extra_headers['If-None-Match'] = meta['etag']
+        if meta is not None and meta.get('last_modified'):
+            extra_headers['If-Modified-Since'] = meta['last_modified']
+        response = create_get_request(url, proxy_server=proxy_server, timeout=timeout, extra_headers=extra_headers)
+
+        with self._lock:
+            if response.status_code == 304 and meta is not None:
+                meta['fetched_at'] = time.time()
+                self._write_meta(url, meta)
+                return self._read_body(url), meta['content_hash']
+            if response.status_code != 200:
+                response.raise_for_status()
+            content = response.content
+            content_hash = hashlib.sha256(content).hexdigest()
+            parsed = meta.get('parsed', {}) if meta is not None and meta['content_hash'] == content_hash else {}
+            self._write_file(self._get_path(url, '.body'), content)
+            self._write_meta(url, {
+                'url': url
+                , 'etag': response.headers.get('ETag')
+                , 'last_modified': response.headers.get('Last-Modified')
+                , 'fetched_at': time.time()
+                , 'content_hash': content_hash
+                , 'parsed': parsed
+            })
+            self._evict()
+            return content, content_hash
+
+    def get_parsed(self, url, parse_func, ttl, parser_name = None, proxy_server = None, timeout = None):
+        '''
+        Get parsed result of a URL, parsing only if its content has changed since the last parse
+        Parameters
+        ----------
+        parse_func : function
+                     function of content in bytes returning a picklable result
+        parser_name : string
+                      name identifying parse_func, its qualified name if None
+        Returns
+        -------
+        Parsed result of the content
+        '''
+        parser_name = parser_name or get_func_name(parse_func)
+        parsed_path = self._get_path(url, '.' + hashlib.sha1(parser_name.encode('utf-8')).hexdigest()[:12] + '.pickle')
+        content, content_hash = self.get(url, ttl, proxy_server=proxy_server, timeout=timeout)
+        with self._lock:
+            meta = self._read_meta(url)
+            if meta is not None and meta.get('parsed', {}).get(parser_name) == content_hash and os.path.exists(parsed_path):
+                with open(parsed_path, 'rb') as parsed_file:
+                    return pickle.load(parsed_file)
+
+        parsed = parse_func(content)
+        with self._lock:
+            meta = self._read_meta(url)
+            if meta is not None and meta['content_hash'] == content_hash:
+                self._write_file(parsed_path, pickle.dumps(parsed))
+                meta.setdefault('parsed', {})[parser_name] = content_hash
+                self._write_meta(url, meta)
+                self._evict()
+        return parsed
+
+# Process-wide response cache
+RESPONSE_CACHE = ResponseCache()
+
+class MemoryCache:
+    '''
+    Bounded in-memory LRU cache of results, e.g. parsed quotes, with a TTL given per source.
+    Concurrent calls for the same key share one in-flight call instead of calling again,
+    and a result of None is shared with them but not cached.
+    '''
+    def __init__(self, max_size = DEFAULT_MEMORY_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entry_dict = collections.OrderedDict()
+        self._flight_dict = {}
+
+    def get(self, source, key, func, ttl):
+        '''
+        Get the cached result of a key, calling func if it is missing or older than ttl
+        Parameters
+        ----------
+        source : string
+                 name of the data source, as keys of different sources may collide
+        key : string
+              key of the result in the source, usually a stock code
+        func : function
+               function without argument returning the result, whose error is raised to every waiting caller
+        ttl : float
+              Seconds during which a cached result is used without calling func
+        Returns
+        -------
+        Result of func, shared by the callers, so it must not be modified
+        '''
+        cache_key = (source, key)
+        with self._lock:
+            entry = self._entry_dict.get(cache_key)
+            if entry is not None and time.monotonic() - entry[0] <= ttl:
+                self._entry_dict.move_to_end(cache_key)
+                statsutil.STATS.increment('memory_cache_total', source=source, result='hit')
+                return entry[1]
+            flight = self._flight_dict.get(cache_key)
+            leader_flag = flight is None
+            if leader_flag:
+                flight = concurrent.futures.Future()
+                self._flight_dict[cache_key] = flight
+        if not leader_flag:
+            statsutil.STATS.increment('memory_cache_total', source=source, result='coalesced')
+            return flight.result()
+
+        statsutil.STATS.increment('memory_cache_total', source=source, result='miss')
+        try:
+            value = func()
+        except BaseException as error:
+            # Interrupts as well, or the waiting callers would wait forever
+            flight.set_exception(error)
+            raise
+        else:
+            with self._lock:
+                if value is not None:
+                    self._entry_dict[cache_key] = (time.monotonic(), value)
+                    self._entry_dict.move_to_end(cache_key)
+                    while len(self._entry_dict) > self.max_size:
+                        self._entry_dict.popitem(last=False)
+            flight.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._flight_dict.pop(cache_key, None)
+
+    def invalidate(self, source, key = None):
+        '''
+        Drop the cached result of a key, or every result of the source if key is None
+        '''
+        with self._lock:
+            for cache_key in list(self._entry_dict):
+                if cache_key[0] == source and (key is None or cache_key[1] == key):
+                    del self._entry_dict[cache_key]
+
+# Process-wide in-memory cache of parsed results
+MEMORY_CACHE = MemoryCache()
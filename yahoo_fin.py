@@ -8,16 +8,20 @@ import sys
 import io
 
 # modules for downloading and URL
-from bs4 import BeautifulSoup
-from requests.exceptions import RequestException, Timeout
+import parseutil
+import statsutil
 import webutil
 
 # modules for Data Science
 import pandas as pd
 import excelutil
+import frameutil
+import normutil
 
 # modules for concurrency
-import concurrent.futures
+import asyncutil
+import retryutil
+import threading
 import time
 from datetime import datetime
 
@@ -30,10 +34,45 @@ LABEL_LOW = 'Low'
 LABEL_CLOSE = 'Close'
 LABEL_ADJCLOSE = 'Adj Close'
 LABEL_VOLUME = 'Volume'
+LABEL_STOCK_CODE = 'stock_code'
+HIST_PRICE_LABELS = [LABEL_OPEN, LABEL_HIGH, LABEL_LOW, LABEL_CLOSE, LABEL_ADJCLOSE]
 
 YAHOO_DATE_FORMAT = '%Y-%m-%d'
+YAHOO_QUOTE_URL = 'https://hk.finance.yahoo.com/quote/{}'
+YAHOO_WELCOME_URL = 'https://hk.finance.yahoo.com/quote/{0}/history?p={0}'
+YAHOO_HIST_URL = 'https://query1.finance.yahoo.com/v7/finance/download/{}?period1={}&period2={}&interval=1d&events=history&crumb={}'
+YAHOO_QUOTE_TD_CLASS = 'C(black) W(51%)'
+# Quote labels and values are both table cells, nothing else is needed
+YAHOO_QUOTE_TD_STRAINER = parseutil.make_strainer('td')
+# Each label cell is followed by its value cell
+YAHOO_QUOTE_SELECTORS = [
+    {'key': parseutil.text_of, 'tag': 'td', 'class': YAHOO_QUOTE_TD_CLASS, 'value': parseutil.next_text('td')}
+]
+
+# Columns of quote results for frameutil.ColumnBuilder, quote labels are added as they appear
+YAHOO_QUOTE_COLUMNS = {LABEL_STOCK_CODE: None}
+# Field types of quote labels of the Hong Kong site for normutil.normalize_df
+YAHOO_QUOTE_SCHEMA = {
+    '前收市價': normutil.FIELD_NUMBER
+    , '開市': normutil.FIELD_NUMBER
+    , '今日波幅': normutil.FIELD_RANGE
+    , '52 週波幅': normutil.FIELD_RANGE
+    , '成交量': normutil.FIELD_INTEGER
+    , '平均成交量': normutil.FIELD_INTEGER
+    , '市值': normutil.FIELD_SCALED
+    , 'Beta 值 (5 年，每月)': normutil.FIELD_NUMBER
+    , '市盈率 (最近 12 個月)': normutil.FIELD_NUMBER
+    , '每股盈利 (最近 12 個月)': normutil.FIELD_NUMBER
+    , '1 年預測目標價': normutil.FIELD_NUMBER
+}
 
 PAGE_TIMEOUT = 5.0
+# Name of the source whose calls in flight are limited adaptively, see retryutil.CONCURRENCY_LIMITER
+YAHOO_SOURCE = 'yahoo'
+# Seconds during which a quote is served from webutil.MEMORY_CACHE
+YAHOO_QUOTE_CACHE_TTL = 15
+# Seconds during which a cookie and crumb pair is reused across symbols
+CRUMB_TTL = 1800
 
 '''
 Functions of Handling Yahoo! Finance Site Cookies
@@ -55,8 +94,7 @@ def get_page_data(stock_id, proxy_server=None, timeout=None):
     '''
     This function is to get page data include cookie and content lines from given stock page
     '''
-    WELCOME_FORMAT = 'https://hk.finance.yahoo.com/quote/{0}/history?p={0}'
-    welcome_url = WELCOME_FORMAT.format(stock_id)
+    welcome_url = YAHOO_WELCOME_URL.format(stock_id)
     response = webutil.create_get_request(url = welcome_url, proxy_server=proxy_server, timeout=timeout)
     cookie = get_cookie_value(response)
     
@@ -90,6 +128,77 @@ def get_cookie_crumb(stock_id, proxy_server=None, timeout=None):
     crumb = split_crumb_store(find_crumb_store(lines))
     return cookie, crumb
 
+class CrumbCache:
+    '''
+    Thread-safe cache of cookie and crumb, which are valid across symbols.
+    Only one thread fetches a new pair while the others wait for it,
+    so one handshake serves a whole batch of historical downloads.
+    '''
+    def __init__(self, ttl = CRUMB_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cookie = None
+        self._crumb = None
+        self._loaded_at = None
+
+    def get_cookie_crumb(self, stock_id, proxy_server=None, timeout=None):
+        '''
+        Get cached cookie and crumb, retrieving them via the page of stock_id if expired
+        '''
+        with self._lock:
+            if self._loaded_at is None or time.time() - self._loaded_at > self.ttl:
+                self._cookie, self._crumb = get_cookie_crumb(stock_id, proxy_server=proxy_server, timeout=timeout)
+                self._loaded_at = time.time()
+            return self._cookie, self._crumb
+
+    def invalidate(self, crumb = None):
+        '''
+        Drop the cached pair, only if it is still the given crumb when one is given
+        '''
+        with self._lock:
+            if crumb is None or crumb == self._crumb:
+                self._cookie = None
+                self._crumb = None
+                self._loaded_at = None
+
+# Process-wide cache of cookie and crumb
+CRUMB_CACHE = CrumbCache()
+
+# Download Yahoo! Finance Historical Prices once
+def fetch_yahoo_hist(
+    stock_code
+    , from_timestamp
+    , to_timestamp
+    , proxy_flag=False
+    , timeout=PAGE_TIMEOUT
+):
+    '''
+    This function is to download historical stock prices once and raise error if it fails.
+    Returns
+    -------
+    Pandas DataFrame of the downloaded CSV content
+    '''
+    logger = logutil.getLogger(__name__)
+
+    proxy_server = None
+    if proxy_flag:
+        proxy_server = webutil.PROXY_POOL.get_proxy()
+        logger.info('download via a proxy server: %s', proxy_server['ip'] + ':' + proxy_server['port'])
+
+    cookie, crumb = CRUMB_CACHE.get_cookie_crumb(stock_code, proxy_server=proxy_server, timeout=timeout)
+    csv_url = YAHOO_HIST_URL.format(stock_code, from_timestamp, to_timestamp, crumb)
+
+    response = webutil.create_get_request(url=csv_url, cookies=cookie, proxy_server=proxy_server, timeout=timeout)
+    if response.status_code in (401, 403):
+        # The crumb is rejected, the next attempt retrieves a new one
+        CRUMB_CACHE.invalidate(crumb)
+    if response.status_code != 200:
+        response.raise_for_status()
+    with statsutil.STATS.timer('decode_seconds', source='yahoo_hist'):
+        decoded_result = response.content.decode('utf-8')
+    with statsutil.STATS.timer('parse_seconds', source='yahoo_hist'):
+        return pd.read_csv(io.StringIO(decoded_result))
+
 # Download Yahoo! Finance Historical Prices
 # For HK only
 def download_yahoo_hist(
@@ -118,47 +227,32 @@ def download_yahoo_hist(
     Pandas DataFrame
     '''
     logger = logutil.getLogger(__name__)
-    df = None
 
     from_timestamp = int(round(datetime.strptime(from_date, YAHOO_DATE_FORMAT).timestamp()))
     to_timestamp = int(round(datetime.strptime(to_date, YAHOO_DATE_FORMAT).timestamp()))
     if from_timestamp >= to_timestamp:
         # invalid time range
         return None
-    
-    CSV_FORMAT = 'https://query1.finance.yahoo.com/v7/finance/download/{}?period1={}&period2={}&interval=1d&events=history&crumb={}'
-    for _ in range(retry_time):
-        try:
-            proxy_server = None
-            if proxy_flag:
-                proxy_server = webutil.get_random_proxy()
-                logger.info('download via a proxy server: %s', proxy_server['ip'] + ':' + proxy_server['port'])
-
-            cookie, crumb = get_cookie_crumb(stock_code, proxy_server=proxy_server, timeout=timeout)
-            csv_url = CSV_FORMAT.format(stock_code, from_timestamp, to_timestamp, crumb)
-
-            response = webutil.create_get_request(url=csv_url, cookies=cookie, proxy_server=proxy_server, timeout=timeout)            
-            if response.status_code != 200:
-                response.raise_for_status()
-            else:
-                df = pd.read_csv(io.StringIO(response.content.decode('utf-8')))    
-            break
-        except Timeout:
-            logger.error('socket timed out - URL %s', csv_url)
-            time.sleep(retry_delay)
-        except RequestException as error:
-            logger.error('Data not retrieved because %s\nURL: %s', error, csv_url)
-            time.sleep(retry_delay)
-        except Exception as error:
-            logger.error('Unexpected error of %s\nURL: %s', error, csv_url)
-            time.sleep(retry_delay)
-
-    else:
-        logger.error('No historical data after %d retry.' % retry_time)
 
+    result = retryutil.call_with_retry(
+        lambda: fetch_yahoo_hist(stock_code, from_timestamp, to_timestamp, proxy_flag=proxy_flag, timeout=timeout)
+        , key=stock_code
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+    )
+    df = result.value
     if df is None:
+        logger.error('No historical data after %d attempts.' % result.attempts)
         return df
 
+    return convert_hist_dtypes(df)
+
+def convert_hist_dtypes(df):
+    '''
+    This function is to change the downloaded historical prices into correct data types
+    Returns
+    -------
+    Pandas DataFrame indexed by Date
+    '''
     # Change correct Data Type
     df[LABEL_DATE] = pd.to_datetime(df[LABEL_DATE], format=YAHOO_DATE_FORMAT)    
     df[LABEL_OPEN] = pd.to_numeric(df[LABEL_OPEN], errors='ignore', downcast='float')
@@ -169,12 +263,132 @@ def download_yahoo_hist(
     df[LABEL_VOLUME] = pd.to_numeric(df[LABEL_VOLUME], errors='ignore', downcast='integer')
     return df.set_index(LABEL_DATE, append=False)
 
+# Download Yahoo! Finance Historical Prices of multiple stocks
+def download_yahoo_hist_df(
+    stock_code_list
+    , from_date='2000-01-01'
+    , to_date=datetime.now().strftime(YAHOO_DATE_FORMAT)
+    , max_workers=10
+    , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , wide=False
+):
+    '''
+    This function is to download historical stock prices of a list of stocks concurrently.
+    Parameters
+    ----------
+    stock_code_list : list
+                      list of Stock Codes in Yahoo! Finance format
+    from_date: string
+               Starting Date in yyyy-mm-dd format
+    to_date: string
+               Ending Date in yyyy-mm-dd format
+    max_workers : int
+                  number of threads
+    wide : boolean
+           Whether the result is a wide panel of (field, stock_code) columns indexed by Date
+    Returns
+    -------
+    Pandas DataFrame in long format indexed by (stock_code, Date), prices in float32 and volume in int64.
+    Missing prices are NaN and missing volume is 0.
+    '''
+    logger = logutil.getLogger(__name__)
+
+    from_timestamp = int(round(datetime.strptime(from_date, YAHOO_DATE_FORMAT).timestamp()))
+    to_timestamp = int(round(datetime.strptime(to_date, YAHOO_DATE_FORMAT).timestamp()))
+    if from_timestamp >= to_timestamp:
+        # invalid time range
+        return None
+
+    logger.info('It starts to download historical prices. Please wait.')
+    # Size the shared connection pools to the number of threads
+    webutil.get_session(pool_size=max_workers)
+    result_list = retryutil.run_batch(
+        lambda stock_code: fetch_yahoo_hist(stock_code, from_timestamp, to_timestamp, proxy_flag=proxy_flag, timeout=timeout)
+        , stock_code_list
+        , max_workers=max_workers
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+    )
+    hist_dict = {
+        result.key: convert_hist_dtypes(result.value)
+        for result in result_list if result.value is not None
+    }
+    logger.info('Downloading historical prices completed with %d of %d stocks.', len(hist_dict), len(stock_code_list))
+
+    if len(hist_dict) <= 0:
+        hist_df = pd.DataFrame(
+            columns=HIST_PRICE_LABELS + [LABEL_VOLUME]
+            , index=pd.MultiIndex.from_arrays([[], []], names=[LABEL_STOCK_CODE, LABEL_DATE])
+            )
+    else:
+        hist_df = pd.concat(hist_dict, names=[LABEL_STOCK_CODE, LABEL_DATE]).sort_index()
+    # Compact data types which stay the same across stocks
+    for label in HIST_PRICE_LABELS:
+        hist_df[label] = pd.to_numeric(hist_df[label], errors='coerce').astype('float32')
+    hist_df[LABEL_VOLUME] = pd.to_numeric(hist_df[LABEL_VOLUME], errors='coerce').fillna(0).astype('int64')
+
+    if wide:
+        return hist_df.unstack(level=LABEL_STOCK_CODE)
+    return hist_df
+
 def get_hk_yahoo_code(stock_number):
     '''
     This function is to convert HKex Stock ID in Yahoo! Finance format
     '''
     return '{:04}.HK'.format(stock_number)
 
+@statsutil.timed('parse_seconds', source='yahoo_quote')
+def parse_stock_quote(stock_page):
+    '''
+    Parse Yahoo! Finance quote page into dictionary of quote label and value
+    '''
+    stock_soup = parseutil.make_soup(stock_page, parse_only=YAHOO_QUOTE_TD_STRAINER)
+    return parseutil.extract_fields(stock_soup, YAHOO_QUOTE_SELECTORS)
+
+def parse_stock_quote_content(content):
+    '''
+    Parse Yahoo! Finance quote page in bytes, it runs in a parser process if parse_workers is positive
+    '''
+    with statsutil.STATS.timer('decode_seconds', source='yahoo_quote'):
+        stock_page = content.decode('utf-8', 'ignore')
+    return parse_stock_quote(stock_page)
+
+def parse_stock_quote_page(stock_code, stock_page):
+    '''
+    Parse decoded Yahoo! Finance quote page of a stock, the parse function of asyncutil.fetch_all
+    '''
+    return parse_stock_quote(stock_page)
+
+# Download Stock Quote once by Stock ID
+def fetch_stock_quote(
+    stock_code
+    , proxy_flag=False
+    , timeout=PAGE_TIMEOUT
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+    ):
+    '''
+    Download stock quote once and raise error if it fails
+    Returns
+    -------
+    stock quote in format of dictionary without stock code
+    '''
+    logger = logutil.getLogger(__name__)
+
+    proxy_server = None
+    if proxy_flag:
+        proxy_server = webutil.PROXY_POOL.get_proxy()
+        logger.info('download via a proxy server: %s', proxy_server['ip'] + ':' + proxy_server['port'])
+
+    response = webutil.create_get_request(url=YAHOO_QUOTE_URL.format(stock_code), proxy_server=proxy_server, timeout=timeout)
+    if response.status_code != 200:
+        response.raise_for_status()
+    pair_list = parseutil.run_parse(parse_stock_quote_content, response.content, parse_workers=parse_workers)
+
+    logger.info('Result of %s has %d records', stock_code, len(pair_list))
+    return pair_list
+
 # Get Stock Quote (list of dict) by Stock ID
 def get_stock_quote(
     stock_code
@@ -182,9 +396,12 @@ def get_stock_quote(
     , retry_time=3
     , retry_delay=10
     , timeout=PAGE_TIMEOUT
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+    , cache_ttl=YAHOO_QUOTE_CACHE_TTL
     ):
     '''
-    Get stock quote in format of dictionary by a given stock Code
+    Get stock quote in format of dictionary by a given stock Code.
+    Concurrent calls for the same stock share one download, whose quote is reused within cache_ttl.
     Parameters
     ----------
     stock_code : string
@@ -195,77 +412,170 @@ def get_stock_quote(
                  number of time to retry if each connection fails
     retry_delay : int
                   How long does it wait if retry fails to get the next
+    parse_workers : int
+                    number of parser processes, 0 parses in the calling thread
+    cache_ttl : float
+                Seconds during which the quote is served from webutil.MEMORY_CACHE, None downloads every time
     Returns
     -------
     stock quote in format of dictionary 
     '''
-    logger = logutil.getLogger(__name__)
-
-    stock_url = 'https://hk.finance.yahoo.com/quote/' + stock_code
-    td_class = "C(black) W(51%)"
-    for _ in range(retry_time):
-        try:
-            td_list = []
-
-            proxy_server = None
-            if proxy_flag:
-                proxy_server = webutil.get_random_proxy()
-                logger.info('download via a proxy server: %s', proxy_server['ip'] + ':' + proxy_server['port'])
-
-            response = webutil.create_get_request(url=stock_url, proxy_server=proxy_server, timeout=timeout)
-            if response.status_code != 200:
-                response.raise_for_status()
-            stock_page = response.content.decode('utf-8', 'ignore')
-            stock_soup = BeautifulSoup(stock_page, 'html.parser')
-            td_list = stock_soup.findAll('td', {"class": td_class})
-
-            logger.info('Result of %s has %d records', stock_code, len(td_list))
-            pair_list = {
-                td.get_text():
-                td.findNext('td').get_text()
-                for td in td_list
-            }
-            break
-        except Timeout:
-            logger.error('socket timed out - URL %s', stock_url)
-            time.sleep(retry_delay)
-        except RequestException as error:
-            logger.error('Data not retrieved because %s\nURL: %s', error, stock_url)
-            time.sleep(retry_delay)
-        except Exception as error:
-            logger.error('Unexpected error of %s\nURL: %s', error, stock_url)
-            time.sleep(retry_delay)
+    download_quote = lambda: retryutil.call_with_retry(
+        lambda: fetch_stock_quote(stock_code, proxy_flag=proxy_flag, timeout=timeout, parse_workers=parse_workers)
+        , key=stock_code
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+    ).value
+    if cache_ttl is None:
+        pair_list = download_quote()
     else:
-        logger.error('No response after %d retry.' % retry_time)
-        pair_list = {}
+        pair_list = webutil.MEMORY_CACHE.get(YAHOO_SOURCE, stock_code, download_quote, cache_ttl)
+    # The cached quote is shared, the stock code goes into a copy
+    pair_list = dict(pair_list or {})
     pair_list.update({'stock_code': stock_code})
     return pair_list
 
+# Iterate Stock Quotes by Stock List as soon as each stock completes
+def iter_stock_quotes(
+    stock_code_list
+    , max_workers=10
+    , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , callback=None
+    , checkpoint=None
+    , adaptive=False
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+    ):
+    '''
+    Yield stock quote in format of dictionary as soon as each stock completes
+    Parameters
+    ----------
+    callback : function
+               function of (retryutil.RetryResult, number of completed stocks, number of stocks)
+               called for every stock before its quote is yielded
+    checkpoint : checkpoint.Checkpoint
+                 stocks completed in it are not downloaded again, and every stock is saved in it as it completes
+    adaptive : boolean
+               Whether calls in flight are limited by retryutil.CONCURRENCY_LIMITER of the source up to max_workers
+    parse_workers : int
+                    number of parser processes shared by the download threads, 0 parses in the threads
+    Returns
+    -------
+    generator of stock quote in format of dictionary
+    '''
+    # Size the shared connection pools to the number of threads
+    webutil.get_session(pool_size=max_workers)
+    for result in retryutil.iter_batch(
+        lambda stock_code: fetch_stock_quote(stock_code, proxy_flag=proxy_flag, timeout=timeout, parse_workers=parse_workers)
+        , stock_code_list
+        , max_workers=max_workers
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+        , callback=callback
+        , checkpoint=checkpoint
+        , concurrency=retryutil.CONCURRENCY_LIMITER.get_concurrency(YAHOO_SOURCE) if adaptive else None
+    ):
+        pair_list = result.value or {}
+        pair_list.update({'stock_code': result.key})
+        yield pair_list
+
 # Get Stock Quote Data Frame by Stock List
 def get_stock_quote_df(
     stock_code_list
     , max_workers=10
     , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , return_status=False
+    , checkpoint=None
+    , adaptive=False
+    , normalize=False
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
     ):
+    '''
+    Get Data Frame of stock quotes by a list of stock codes
+    Parameters
+    ----------
+    return_status : boolean
+                    Whether a Data Frame of attempts and final status per stock is returned as well
+    checkpoint : checkpoint.Checkpoint
+                 stocks completed in it are not downloaded again, see retryutil.iter_batch
+    adaptive : boolean
+               Whether calls in flight are limited by retryutil.CONCURRENCY_LIMITER of the source up to max_workers
+    normalize : boolean
+                Whether quote fields are converted into numbers by YAHOO_QUOTE_SCHEMA, ranges into low and high
+    parse_workers : int
+                    number of parser processes shared by the download threads, 0 parses in the threads
+    Returns
+    -------
+    Data Frame of stock quotes, or a tuple of it and the status Data Frame
+    '''
     logger = logutil.getLogger(__name__)
 
-    stock_quote_list = []   
+    result_list = []
     # Threads start and it takes quite a long time due to multiple network I/O
     logger.info('It starts to download stock quotes. Please wait.')
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_stock_code = {
-            executor.submit(get_stock_quote, stock_code, proxy_flag): 
-            stock_code for stock_code in stock_code_list
-        }
-
-    # Update thread status for monitoring
-    for future in concurrent.futures.as_completed(future_to_stock_code):
-        stock_quote_list.append(future.result())
+    stock_quote_builder = frameutil.ColumnBuilder(YAHOO_QUOTE_COLUMNS)
+    stock_quote_builder.extend(iter_stock_quotes(
+        stock_code_list
+        , max_workers=max_workers
+        , proxy_flag=proxy_flag
+        , retry_time=retry_time
+        , retry_delay=retry_delay
+        , timeout=timeout
+        , callback=lambda result, completed_count, total_count: result_list.append(result)
+        , checkpoint=checkpoint
+        , adaptive=adaptive
+        , parse_workers=parse_workers
+    ))
     
     logger.info('Downloading stock quotes completed.')
-    return pd.DataFrame(
-        data=stock_quote_list
-        ).set_index('stock_code', append=False)
+    stock_quote_df = stock_quote_builder.to_df().set_index('stock_code', append=False)
+    if normalize:
+        stock_quote_df = normutil.normalize_df(stock_quote_df, YAHOO_QUOTE_SCHEMA)
+    if return_status:
+        return stock_quote_df, retryutil.get_status_df(result_list)
+    return stock_quote_df
+
+# Get Stock Quote Data Frame by Stock List with asyncio
+async def get_stock_quote_df_async(
+    stock_code_list
+    , concurrency=asyncutil.DEFAULT_CONCURRENCY
+    , proxy_flag=False
+    , retry_time=3
+    , retry_delay=10
+    , timeout=PAGE_TIMEOUT
+    , normalize=False
+    , parse_workers=parseutil.DEFAULT_PARSE_WORKERS
+    ):
+    '''
+    Asyncio counterpart of get_stock_quote_df running up to concurrency requests at the same time
+    '''
+    logger = logutil.getLogger(__name__)
+
+    logger.info('It starts to download stock quotes. Please wait.')
+    result_list = await asyncutil.fetch_all(
+        [(stock_code, YAHOO_QUOTE_URL.format(stock_code)) for stock_code in stock_code_list]
+        , parse_stock_quote_page
+        , concurrency=concurrency
+        , proxy_flag=proxy_flag
+        , policies=retryutil.get_default_policies(retry_time, retry_delay)
+        , timeout=timeout
+        , parse_workers=parse_workers
+    )
+
+    stock_quote_builder = frameutil.ColumnBuilder(YAHOO_QUOTE_COLUMNS)
+    for result in result_list:
+        pair_list = result.value or {}
+        pair_list.update({'stock_code': result.key})
+        stock_quote_builder.append(pair_list)
+
+    logger.info('Downloading stock quotes completed.')
+    stock_quote_df = stock_quote_builder.to_df().set_index('stock_code', append=False)
+    if normalize:
+        stock_quote_df = normutil.normalize_df(stock_quote_df, YAHOO_QUOTE_SCHEMA)
+    return stock_quote_df
 
 ### Run as a main program ###
 if __name__ == '__main__':